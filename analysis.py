@@ -0,0 +1,802 @@
+# Automatic collimation analysis: find the primary and secondary mirror
+# outlines, the primary centre marker and the reflected rings in a frame
+#
+# Detection runs on a small pyramid level (about coarse_size pixels on the
+# short side). Each feature is then refined at full resolution, looking only
+# at short rays across its edge or at a small ROI around it, so the cost is
+# nearly independent of the sensor size.
+import threading, time
+import cv2
+import numpy as np
+from PyQt6.QtCore import QThread, pyqtSignal
+
+from frames import FrameMailbox, to_gray
+from instrumentation import pipeline_stats
+
+
+def downsample(gray, factor):
+    """Integer INTER_AREA decimation (OpenCV fast path)."""
+    if factor <= 1:
+        return gray
+    h, w = gray.shape[:2]
+    gray = gray[: h - h % factor, : w - w % factor]
+    return cv2.resize(gray, (w // factor, h // factor), interpolation=cv2.INTER_AREA)
+
+
+def fit_circle(xs, ys):
+    """
+    Least squares (Kasa) circle through the points, with one round of
+    outlier rejection. Returns (cx, cy, r) or None.
+    """
+    keep = np.ones(len(xs), bool)
+    for _ in range(2):
+        if keep.sum() < 6:
+            return None
+        x, y = xs[keep], ys[keep]
+        a = np.column_stack((x, y, np.ones_like(x)))
+        sol = np.linalg.lstsq(a, x * x + y * y, rcond=None)[0]
+        cx, cy = sol[0] / 2, sol[1] / 2
+        r = np.sqrt(max(sol[2] + cx * cx + cy * cy, 0.0))
+        residual = np.abs(np.hypot(xs - cx, ys - cy) - r)
+        mad = np.median(residual[keep]) + 0.25
+        keep = residual < 3.0 * mad
+    return float(cx), float(cy), float(r)
+
+
+def _ray_signal(image, circle, kind, width, rays):
+    # Radial profiles of +-width pixels across the circle, as an edge or ring
+    # response per ray. Returns (angles, signal, offset) or None.
+    cx, cy, r = circle
+    h, w = image.shape[:2]
+    angles = np.linspace(0, 2 * np.pi, rays, endpoint=False)
+    steps = np.arange(-width, width + 1, dtype=np.float32)
+    radii = r + steps
+    xs = cx + np.outer(np.cos(angles), radii)
+    ys = cy + np.outer(np.sin(angles), radii)
+    inside = (
+        (xs.min(axis=1) >= 0)
+        & (ys.min(axis=1) >= 0)
+        & (xs.max(axis=1) <= w - 1)
+        & (ys.max(axis=1) <= h - 1)
+    )
+    if inside.sum() < 6:
+        return None
+    xs, ys, angles = xs[inside], ys[inside], angles[inside]
+
+    profiles = image[np.rint(ys).astype(int), np.rint(xs).astype(int)]
+    profiles = profiles.astype(np.float32)
+    if profiles.ndim == 3:
+        profiles = profiles.mean(axis=2)
+    profiles = cv2.blur(profiles, (3, 1))  # along the ray
+
+    if kind in ("rise", "fall"):
+        signal = np.diff(profiles, axis=1)
+        signal = signal if kind == "rise" else -signal
+        offset = 0.5  # diff sample i lies between profile samples i and i+1
+    else:
+        signal = profiles - np.median(profiles, axis=1, keepdims=True)
+        signal = signal if kind == "peak" else -signal
+        offset = 0.0
+    return angles, signal, offset
+
+
+def edge_strength(image, circle, kind, width=4, rays=64):
+    """Median edge or ring response across a circle, 0 if out of the image."""
+    rays = _ray_signal(image, circle, kind, width, rays)
+    if rays is None:
+        return 0.0
+    return float(np.median(rays[1].max(axis=1)))
+
+
+def refine_circle(image, circle, kind, width, rays=64, min_strength=0.0):
+    """
+    Refine a circle (cx, cy, r) in full resolution pixels by locating its
+    edge on `rays` short radial profiles of +-width pixels and fitting a
+    circle through the edge points.
+
+    kind is "rise" (dark inside, bright outside), "fall" (the opposite),
+    "peak" (thin bright ring) or "valley" (thin dark ring). Profiles without
+    a clear edge, e.g. along a spider vane, are ignored. With min_strength,
+    at least half of the profiles must reach that response or the circle
+    counts as not found.
+    """
+    cx, cy, r = circle
+    rays = _ray_signal(image, circle, kind, width, rays)
+    if rays is None:
+        return None
+    angles, signal, offset = rays
+    best = signal.argmax(axis=1)
+    strength = signal[np.arange(len(best)), best]
+    good = strength > max(0.5 * np.median(strength), min_strength)
+    good &= (best > 0) & (best < signal.shape[1] - 1)
+    if good.sum() < (len(good) // 2 if min_strength > 0 else 6):
+        return None
+
+    # parabolic sub-pixel position of the edge or ring
+    i = np.arange(len(best))[good]
+    b = best[good]
+    left, centre, right = signal[i, b - 1], signal[i, b], signal[i, b + 1]
+    denom = left - 2 * centre + right
+    shift = np.where(np.abs(denom) > 1e-6, 0.5 * (left - right) / denom, 0.0)
+    edge = r - width + b + offset + np.clip(shift, -1, 1)
+    return fit_circle(
+        cx + edge * np.cos(angles[good]), cy + edge * np.sin(angles[good])
+    )
+
+
+def refine_marker(image, centre, radius):
+    """
+    Intensity weighted centroid of the bright marker in a small ROI.
+    Returns (cx, cy, r) in full resolution pixels or None.
+    """
+    cx, cy = centre
+    half = int(radius * 2) + 4
+    x0, y0 = max(0, int(cx) - half), max(0, int(cy) - half)
+    roi = to_gray(image[y0 : int(cy) + half + 1, x0 : int(cx) + half + 1])
+    if roi.size == 0:
+        return None
+    level, mask = cv2.threshold(roi, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+    weights = cv2.subtract(roi, level, dtype=cv2.CV_32F)
+    weights[mask == 0] = 0
+    m = cv2.moments(weights)
+    if m["m00"] <= 0:
+        return None
+    return (
+        x0 + m["m10"] / m["m00"],
+        y0 + m["m01"] / m["m00"],
+        float(np.sqrt(cv2.countNonZero(mask) / np.pi)),
+    )
+
+
+def largest_contour(mask):
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
+    contours = [c for c in contours if len(c) >= 5]
+    return max(contours, key=cv2.contourArea) if contours else None
+
+
+def ellipse_circle(contour):
+    (x, y), (a, b), _ = cv2.fitEllipse(contour)
+    return x, y, (a + b) / 4
+
+
+def analyse_frame(image, scale=1.0, center_focus=(0.0, 0.0), coarse_size=320):
+    """
+    Find the collimation features in a BGR or grayscale frame.
+
+    Returns a dict with "primary", "secondary" and "marker" as (x, y, r) or
+    None, "rings" as a list of (x, y, r), and "secondary_offset" and
+    "marker_offset", the (dx, dy) decentre of the secondary outline and of
+    the primary centre marker from center_focus (or None). All values are in
+    sensor pixels; scale is the frame size relative to the sensor.
+    """
+    result = {
+        "primary": None,
+        "secondary": None,
+        "marker": None,
+        "rings": [],
+        "secondary_offset": None,
+        "marker_offset": None,
+    }
+    gray = to_gray(image)
+    factor = max(1, min(gray.shape) // coarse_size)
+    small = cv2.GaussianBlur(downsample(gray, factor), (5, 5), 0)
+    width = max(6, 2 * factor)  # refinement search range, full res pixels
+
+    def full(circle):
+        x, y, r = circle
+        return (x + 0.5) * factor - 0.5, (y + 0.5) * factor - 0.5, r * factor
+
+    # primary: outline of the largest lit area, closed over the spider vanes
+    # that would otherwise cut it into quadrants
+    _, bright = cv2.threshold(small, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
+    contour = largest_contour(cv2.morphologyEx(bright, cv2.MORPH_CLOSE, kernel))
+    if contour is None:
+        return result
+    primary = ellipse_circle(contour)
+    result["primary"] = refine_circle(gray, full(primary), "fall", width)
+
+    # secondary: the dark silhouette inside the primary, spider vanes opened away
+    inside = np.zeros_like(bright)
+    cv2.circle(
+        inside,
+        (round(primary[0]), round(primary[1])),
+        round(primary[2] * 0.95),
+        255,
+        -1,
+    )
+    dark = cv2.bitwise_and(cv2.bitwise_not(bright), inside)
+    dark = cv2.morphologyEx(dark, cv2.MORPH_OPEN, kernel)
+    contour = largest_contour(dark)
+    if contour is None:
+        return _to_sensor(result, scale, center_focus)
+    secondary = ellipse_circle(contour)
+    result["secondary"] = refine_circle(gray, full(secondary), "rise", width)
+
+    # centre marker: the brightest blob well inside the secondary
+    sx, sy, sr = secondary
+    core = np.zeros_like(bright)
+    cv2.circle(core, (round(sx), round(sy)), round(sr * 0.7), 255, -1)
+    values = small[core > 0]
+    if values.size:
+        level = (int(values.max()) + int(np.median(values))) / 2
+        spot = cv2.inRange(small, level, 255)
+        contour = largest_contour(cv2.bitwise_and(spot, core))
+        if contour is not None:
+            m = cv2.moments(contour)
+            if m["m00"] > 0:
+                centre = full((m["m10"] / m["m00"], m["m01"] / m["m00"], 0))[:2]
+                radius = np.sqrt(cv2.contourArea(contour) / np.pi) * factor
+                result["marker"] = refine_marker(image, centre, max(radius, 4))
+
+    # reflected rings: circles roughly concentric with the secondary that are
+    # not one of the outlines found above. The Hough transform dominates the
+    # cost, so it runs on an even smaller level.
+    ring_scale = 0.7
+    level = cv2.resize(
+        small, None, fx=ring_scale, fy=ring_scale, interpolation=cv2.INTER_AREA
+    )
+    circles = cv2.HoughCircles(
+        level,
+        cv2.HOUGH_GRADIENT_ALT,
+        1.5,
+        2,
+        param1=80,
+        param2=0.8,
+        minRadius=4,
+        maxRadius=round(primary[2] * 0.9 * ring_scale),
+    )
+    circles = [] if circles is None else circles[0] / ring_scale
+    known = [c for c in (primary, secondary) if c is not None]
+    for x, y, r in circles:
+        if np.hypot(x - sx, y - sy) > 0.25 * sr + 2:
+            continue
+        if any(abs(r - k[2]) < 3 and np.hypot(x - k[0], y - k[1]) < 4 for k in known):
+            continue
+        if r < 0.3 * sr or r > 0.9 * primary[2]:
+            continue  # the centre marker or the primary edge
+        ring_value = _circle_mean(small, x, y, r)
+        kind = "peak" if ring_value > _circle_mean(small, x, y, r + 3) else "valley"
+        ring = refine_circle(gray, full((x, y, r)), kind, width)
+        if ring is not None:
+            result["rings"].append(ring)
+            known.append((x, y, r))
+    return _to_sensor(result, scale, center_focus)
+
+
+def _circle_mean(image, x, y, r, points=32):
+    angles = np.linspace(0, 2 * np.pi, points, endpoint=False)
+    xs = np.clip(np.rint(x + r * np.cos(angles)), 0, image.shape[1] - 1)
+    ys = np.clip(np.rint(y + r * np.sin(angles)), 0, image.shape[0] - 1)
+    return float(image[ys.astype(int), xs.astype(int)].mean())
+
+
+def _sensor(circle, scale):
+    if circle is None:
+        return None
+    x, y, r = circle
+    # pixel centres: frame pixel i covers sensor pixels [i, i + 1) / scale
+    return (x + 0.5) / scale - 0.5, (y + 0.5) / scale - 0.5, r / scale
+
+
+# Convert frame pixels to sensor pixels and add the decentre vectors
+def _to_sensor(result, scale, center_focus):
+    for key in ("primary", "secondary", "marker"):
+        result[key] = _sensor(result[key], scale)
+    result["rings"] = [_sensor(ring, scale) for ring in result["rings"]]
+    fx, fy = center_focus
+    for key in ("secondary", "marker"):
+        if result[key] is not None:
+            x, y, _ = result[key]
+            result[f"{key}_offset"] = (x - fx, y - fy)
+    return result
+
+
+def _donut(gray, level):
+    # Outline and central shadow of the brightest blob above level, as
+    # (x, y, r) from the moments of the filled outline and of the largest
+    # hole in it. Either is None if not found.
+    mask = cv2.inRange(gray, level, 255)
+    contour = largest_contour(mask)
+    if contour is None:
+        return None, None
+    filled = np.zeros_like(mask)
+    cv2.drawContours(filled, [contour], -1, 255, -1)
+    m = cv2.moments(filled, True)
+    if m["m00"] <= 0:
+        return None, None
+    donut = (m["m10"] / m["m00"], m["m01"] / m["m00"], np.sqrt(m["m00"] / np.pi))
+
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
+    hole = cv2.morphologyEx(cv2.subtract(filled, mask), cv2.MORPH_OPEN, kernel)
+    contour = largest_contour(hole)
+    if contour is None:
+        return donut, None
+    hole = np.zeros_like(mask)
+    cv2.drawContours(hole, [contour], -1, 255, -1)
+    m = cv2.moments(hole, True)
+    if m["m00"] <= 0:
+        return donut, None
+    shadow = (m["m10"] / m["m00"], m["m01"] / m["m00"], np.sqrt(m["m00"] / np.pi))
+    return donut, shadow
+
+
+def analyse_star(image, scale=1.0, coarse_size=320):
+    """
+    Star test: find a defocused star donut and its central shadow.
+
+    The donut is found from moments of the thresholded blob on a small
+    pyramid level, then measured again at full resolution in an ROI just
+    around it. Returns a dict with "donut" and "shadow" as (x, y, r) or
+    None, "shadow_offset", the (dx, dy) of the shadow from the donut centre,
+    and "offset_ratio", its length relative to the donut radius. All values
+    are in sensor pixels; scale is the frame size relative to the sensor.
+    """
+    result = {
+        "donut": None,
+        "shadow": None,
+        "shadow_offset": None,
+        "offset_ratio": None,
+    }
+    factor = max(1, min(image.shape[:2]) // coarse_size)
+    small = cv2.GaussianBlur(to_gray(downsample(image, factor)), (5, 5), 0)
+    background, peak = float(np.median(small)), float(small.max())
+    if peak - background < 20:
+        return result  # no star
+    level = background + 0.3 * (peak - background)
+    donut, _ = _donut(small, level)
+    if donut is None:
+        return result
+
+    # full resolution, in the ROI around the coarse outline
+    x = (donut[0] + 0.5) * factor - 0.5
+    y = (donut[1] + 0.5) * factor - 0.5
+    r = donut[2] * factor * 1.25 + 2 * factor
+    h, w = image.shape[:2]
+    x0, y0 = max(0, int(x - r)), max(0, int(y - r))
+    x1, y1 = min(w, int(x + r) + 1), min(h, int(y + r) + 1)
+    roi = cv2.GaussianBlur(to_gray(image[y0:y1, x0:x1]), (5, 5), 0)
+    donut, shadow = _donut(roi, level)
+    if donut is None:
+        return result
+
+    def sensor(circle):
+        if circle is None:
+            return None
+        return _sensor((circle[0] + x0, circle[1] + y0, circle[2]), scale)
+
+    result["donut"], result["shadow"] = sensor(donut), sensor(shadow)
+    if shadow is not None:
+        dx = result["shadow"][0] - result["donut"][0]
+        dy = result["shadow"][1] - result["donut"][1]
+        result["shadow_offset"] = (dx, dy)
+        result["offset_ratio"] = float(np.hypot(dx, dy) / result["donut"][2])
+    return result
+
+
+def _fit_harmonic(angles, radii):
+    """
+    Least squares r = r0 + a cos(t) + b sin(t) through the edge radii, with
+    one round of outlier rejection. (a, b) is the offset of the edge's centre
+    from the unwrap centre. Returns (r0, a, b) or None.
+    """
+    keep = np.ones(len(radii), bool)
+    basis = np.column_stack((np.ones_like(angles), np.cos(angles), np.sin(angles)))
+    for _ in range(2):
+        if keep.sum() < 12:
+            return None
+        sol = np.linalg.lstsq(basis[keep], radii[keep], rcond=None)[0]
+        residual = np.abs(basis @ sol - radii)
+        mad = np.median(residual[keep]) + 0.25
+        keep = residual < 3.0 * mad
+    return tuple(float(v) for v in sol)
+
+
+class RadialProfile:
+    """
+    Concentricity measured on a polar unwrap of the frame around the
+    overlay centre (center_focus plus the center offset).
+
+    The remap tables are built once and cached; they are only rebuilt when
+    the centre or the radius range changes, so each frame costs one
+    cv2.remap and a few vectorised passes over the small polar image.
+    The strongest falling edge of the mean radial profile is taken as the
+    primary outline and the strongest rising edge inside it as the
+    secondary silhouette. Each edge is located on every angle and fitted
+    with r0 + a cos(t) + b sin(t), whose (a, b) is that outline's offset
+    from the centre.
+    """
+
+    def __init__(self, angles=360, max_samples=1024, inner=0.08):
+        self.angles = angles
+        self.max_samples = max_samples  # radial samples, at most one per pixel
+        self.inner = inner  # part of the radius range skipped (centre marker)
+        self.key = None
+        self.rebuilds = 0
+
+    # Remap tables for the frame pixel centre and radius range, cached
+    def unwrap_maps(self, centre, radius_range):
+        key = (centre, radius_range)
+        if key != self.key:
+            cx, cy = centre
+            r0, r1 = radius_range
+            samples = int(min(self.max_samples, max(32, r1 - r0)))
+            self.theta = np.linspace(0, 2 * np.pi, self.angles, endpoint=False)
+            self.radii = np.linspace(r0, r1, samples)
+            map_x = cx + np.outer(np.cos(self.theta), self.radii)
+            map_y = cy + np.outer(np.sin(self.theta), self.radii)
+            # fixed point tables, about twice as fast to remap with
+            self.maps = cv2.convertMaps(
+                map_x.astype(np.float32), map_y.astype(np.float32), cv2.CV_16SC2
+            )
+            self.key = key
+            self.rebuilds += 1
+        return self.maps
+
+    def measure(self, image, scale=1.0, centre=(0.0, 0.0)):
+        """
+        Measure a BGR or grayscale frame around centre (sensor pixels).
+
+        Returns a dict with "primary" and "secondary" as (r, dx, dy) or None,
+        "decentre", the primary outline's (dx, dy) offset from the centre,
+        "tilt", the secondary's (dx, dy) offset from the primary outline, and
+        "error", the length of the tilt vector. All values are in sensor
+        pixels. Returns None when the centre is too close to the frame edge.
+        """
+        h, w = image.shape[:2]
+        cx, cy = (centre[0] + 0.5) * scale - 0.5, (centre[1] + 0.5) * scale - 0.5
+        r1 = int(min(cx, cy, w - 1 - cx, h - 1 - cy))
+        if r1 < 32:
+            return None
+        maps = self.unwrap_maps((cx, cy), (int(r1 * self.inner), r1))
+        polar = to_gray(cv2.remap(image, *maps, cv2.INTER_LINEAR))
+        polar = cv2.GaussianBlur(polar.astype(np.float32), (5, 1), 0)
+        signal = np.diff(polar, axis=1)  # along the radius
+        step = self.radii[1] - self.radii[0]
+
+        # On each angle the primary outline is the strongest fall and the
+        # secondary silhouette the strongest rise inside it; the angles on a
+        # spider vane have no clear edge and are dropped
+        def edge(sign, end):
+            if end < 8:
+                return None
+            fit = self._locate(sign * signal, 0, end)
+            if fit is not None:  # again, close to the fitted outline
+                r0, a, b = fit
+                centres = r0 + a * np.cos(self.theta) + b * np.sin(self.theta)
+                fit = self._locate(sign * signal, np.rint(centres).astype(int) - 4, 9)
+            return fit
+
+        def sensor(fit):
+            if fit is None:
+                return None
+            r0, a, b = fit
+            radius = self.radii[0] + (r0 + 0.5) * step  # diff sits between samples
+            return radius / scale, a * step / scale, b * step / scale
+
+        fall = edge(-1, signal.shape[1])
+        rise = fall and edge(1, int(fall[0] - np.hypot(fall[1], fall[2])) - 8)
+        primary, secondary = sensor(fall), sensor(rise)
+        result = {
+            "primary": primary,
+            "secondary": secondary,
+            "decentre": primary and primary[1:],
+            "tilt": None,
+            "error": None,
+        }
+        if primary and secondary:
+            dx, dy = secondary[1] - primary[1], secondary[2] - primary[2]
+            result["tilt"] = (dx, dy)
+            result["error"] = float(np.hypot(dx, dy))
+        return result
+
+    # Find the edge on each angle in the `width` samples from start (one
+    # for all angles or one per angle) and fit it. Returns (r0, a, b) in
+    # samples of the signal, or None.
+    def _locate(self, signal, start, width):
+        rows = np.arange(signal.shape[0])
+        if np.isscalar(start):
+            values = signal[:, start : start + width]
+            columns = np.broadcast_to(start + np.arange(values.shape[1]), values.shape)
+        else:
+            columns = start[:, None] + np.arange(width)
+            columns = np.clip(columns, 0, signal.shape[1] - 1)
+            values = signal[rows[:, None], columns]
+        best = values.argmax(axis=1)
+        strength = values[rows, best]
+        good = strength > 0.5 * np.median(strength)
+        good &= (best > 0) & (best < values.shape[1] - 1)
+        if good.sum() < 12:
+            return None
+
+        # parabolic sub-pixel position, as in refine_circle
+        i, b = rows[good], best[good]
+        left, centre, right = values[i, b - 1], values[i, b], values[i, b + 1]
+        denom = left - 2 * centre + right
+        shift = np.where(np.abs(denom) > 1e-6, 0.5 * (left - right) / denom, 0.0)
+        position = columns[i, b] + np.clip(shift, -1, 1)
+        return _fit_harmonic(self.theta[good], position)
+
+
+class FeatureTracker:
+    """
+    Tracking on top of analyse_frame().
+
+    After a full search has locked on the primary and secondary, later frames
+    are only refined around where each feature is predicted to be: short
+    radial profiles across the outlines and a small ROI around the marker,
+    so the cost follows the feature size rather than the sensor size. Each
+    feature has an alpha-beta filter (position and velocity) for the
+    prediction. Missing either mirror outline (edge contrast below half of
+    what it was at lock time), or a jump larger than the search range, is a
+    loss of lock and the next frame gets a full search.
+    So does every research_interval'th frame, to pick up rings that came
+    into view.
+    """
+
+    def __init__(self, search=12.0, alpha=0.85, beta=0.3, research_interval=50):
+        self.search = search  # base search range, sensor pixels
+        self.alpha = alpha
+        self.beta = beta
+        self.research_interval = research_interval
+        self.enabled = True
+        self.reset()
+
+        # Counters (read them with stats())
+        self.hits = 0  # frames analysed by tracking
+        self.misses = 0  # tracking lost lock
+        self.full_searches = 0
+        self.track_time = 0.0
+        self.full_time = 0.0
+
+    def reset(self):
+        # per feature: [x, y, r, vx, vy] in sensor pixels and pixels/second
+        self.state = {}
+        # per feature: (refine_circle kind, edge strength at lock time)
+        self.edges = {}
+        self.last_timestamp = None
+        self.since_search = 0
+
+    def analyse(self, image, scale, center_focus, timestamp):
+        result = None
+        tracked = False
+        if self.enabled and self.state and self.since_search < self.research_interval:
+            start = time.perf_counter()
+            result = self.track(image, scale, center_focus, timestamp)
+            if result is None:
+                self.misses += 1
+            else:
+                tracked = True
+                self.hits += 1
+                self.since_search += 1
+                self.track_time += time.perf_counter() - start
+        if result is None:
+            start = time.perf_counter()
+            result = analyse_frame(image, scale, center_focus)
+            self.full_searches += 1
+            self.full_time += time.perf_counter() - start
+            self.lock(result, image, scale, timestamp)
+        result["tracked"] = tracked
+        return result
+
+    # Seed the filters from a full search, or drop the lock if the mirrors
+    # were not both found
+    def lock(self, result, image, scale, timestamp):
+        self.reset()
+        if result["primary"] is None or result["secondary"] is None:
+            return
+        features = {"primary": result["primary"], "secondary": result["secondary"]}
+        if result["marker"] is not None:
+            features["marker"] = result["marker"]
+        for i, ring in enumerate(result["rings"]):
+            features[i] = ring
+        for key, (x, y, r) in features.items():
+            self.state[key] = [x, y, r, 0.0, 0.0]
+            if key == "marker":
+                continue
+            circle = ((x + 0.5) * scale - 0.5, (y + 0.5) * scale - 0.5, r * scale)
+            if key == "primary":
+                kind = "fall"
+            elif key == "secondary":
+                kind = "rise"
+            else:
+                kind = self.ring_kind(image, circle)
+            self.edges[key] = (kind, edge_strength(image, circle, kind))
+        self.last_timestamp = timestamp
+
+    def track(self, image, scale, center_focus, timestamp):
+        dt = 0.0 if self.last_timestamp is None else timestamp - self.last_timestamp
+        found = {}
+        for key, (x, y, r, vx, vy) in self.state.items():
+            px, py = x + vx * dt, y + vy * dt
+            # search wider while the feature is moving
+            search = self.search + 0.5 * np.hypot(vx, vy) * dt
+            width = max(4, round(search * scale))
+            seed = ((px + 0.5) * scale - 0.5, (py + 0.5) * scale - 0.5, r * scale)
+            if key == "marker":
+                circle = refine_marker(image, seed[:2], seed[2])
+            else:
+                kind, strength = self.edges[key]
+                circle = refine_circle(
+                    image, seed, kind, width, min_strength=0.5 * strength
+                )
+            if circle is not None:
+                sx = (circle[0] + 0.5) / scale - 0.5
+                sy = (circle[1] + 0.5) / scale - 0.5
+                jump = np.hypot(sx - px, sy - py)
+                if jump <= search and (
+                    key == "marker" or abs(circle[2] / scale - r) <= search
+                ):
+                    found[key] = (sx, sy, circle[2] / scale, px, py)
+            if key in ("primary", "secondary") and key not in found:
+                return None  # lost lock
+
+        # alpha-beta update of the features that were found
+        for key, (sx, sy, sr, px, py) in found.items():
+            state = self.state[key]
+            rx, ry = sx - px, sy - py
+            state[0] = px + self.alpha * rx
+            state[1] = py + self.alpha * ry
+            state[2] = sr
+            if dt > 0:
+                state[3] += self.beta * rx / dt
+                state[4] += self.beta * ry / dt
+        for key in set(self.state) - set(found):
+            del self.state[key]  # a ring or the marker faded, forget it
+            self.edges.pop(key, None)
+        self.last_timestamp = timestamp
+
+        # report the measurements, the filter is only used for prediction
+        def frame_circle(key):
+            if key not in found:
+                return None
+            x, y, r = found[key][:3]
+            return (x + 0.5) * scale - 0.5, (y + 0.5) * scale - 0.5, r * scale
+
+        result = {
+            "primary": frame_circle("primary"),
+            "secondary": frame_circle("secondary"),
+            "marker": frame_circle("marker"),
+            "rings": [frame_circle(k) for k in found if isinstance(k, int)],
+            "secondary_offset": None,
+            "marker_offset": None,
+        }
+        return _to_sensor(result, scale, center_focus)
+
+    # A reflected ring brighter or darker than its surroundings
+    @staticmethod
+    def ring_kind(image, circle):
+        x, y, r = circle
+        gray = image if image.ndim == 2 else image[..., 1]
+        on = _circle_mean(gray, x, y, r)
+        off = (_circle_mean(gray, x, y, r + 6) + _circle_mean(gray, x, y, r - 6)) / 2
+        return "peak" if on > off else "valley"
+
+    def stats(self):
+        frames = self.hits + self.full_searches
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "full_searches": self.full_searches,
+            "hit_rate": self.hits / frames if frames else None,
+            "track_ms": 1000 * self.track_time / self.hits if self.hits else None,
+            "full_ms": (
+                1000 * self.full_time / self.full_searches
+                if self.full_searches
+                else None
+            ),
+        }
+
+
+class AnalysisThread(QThread):
+    """
+    Analyses the newest frame, at its own pace, so analysis never holds up
+    capture or display. Frames are handed over with submit() (retained
+    until analysed, only the newest is kept) and every result is emitted
+    with resultReady. The FeatureTracker tracks the features between full
+    searches unless tracking is switched off. With concentricity on, each
+    result also carries the RadialProfile measurement around the overlay
+    centre. In star test mode frames go to analyse_star() instead. max_rate
+    caps the analysis rate (0 = as fast as frames and the CPU allow).
+    """
+
+    resultReady = pyqtSignal(object)
+
+    def __init__(self, max_rate=0):
+        super().__init__()
+        self.max_rate = max_rate
+        self.center_focus = (0.0, 0.0)
+        self.mailbox = FrameMailbox()
+        self._wake = threading.Event()
+        self.running = False
+        self.analysed = 0
+        self.tracker = FeatureTracker()
+        self.center_offset = (0, 0)
+        self.concentricity = False
+        self.profile = RadialProfile()
+        self.star_test = False
+
+    # Called from the GUI thread, takes effect from the next frame
+    def set_tracking(self, enabled):
+        self.tracker.enabled = enabled
+
+    def set_concentricity(self, enabled):
+        self.concentricity = enabled
+
+    def set_star_test(self, enabled):
+        self.star_test = enabled
+
+    # Called from the GUI thread with each new frame
+    def submit(self, frame):
+        self.mailbox.post(frame.retain())
+        self._wake.set()
+
+    def set_center_focus(self, x, y):
+        self.center_focus = (x, y)
+
+    # Overlay centre offset from center_focus, for the radial profile
+    def set_center_offset(self, x, y):
+        self.center_offset = (x, y)
+
+    def run(self):
+        self.running = True
+        next_time = 0.0
+        while self.running:
+            if not self._wake.wait(0.1):
+                continue
+            self._wake.clear()
+            frame = self.mailbox.take()
+            if frame is None:
+                continue
+            try:
+                start = time.perf_counter()
+                result = self.analyse(frame)
+            except Exception as e:
+                # e.g. a cv2 error on an odd frame, or a shape mismatch right
+                # after a resolution or grayscale switch: skip the frame, the
+                # thread must keep running
+                print(f"Analysis of frame {frame.seq} failed: {e!r}")
+                continue
+            finally:
+                frame.release()
+            if pipeline_stats.enabled:
+                pipeline_stats.add("analysis", start)
+            result["seq"] = frame.seq
+            result["timestamp"] = frame.timestamp
+            result["duration"] = time.perf_counter() - start
+            result["tracking"] = self.tracker.stats()
+            self.analysed += 1
+            self.resultReady.emit(result)
+
+            if self.max_rate > 0:
+                next_time = max(next_time + 1.0 / self.max_rate, start)
+                delay = next_time - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+        self.mailbox.clear()
+
+    # The star test, or the collimation features (and the concentricity)
+    def analyse(self, frame):
+        if self.star_test:
+            result = analyse_star(frame.image, frame.scale)
+            result["star_test"] = True
+            return result
+        result = self.tracker.analyse(
+            frame.image, frame.scale, self.center_focus, frame.timestamp
+        )
+        result["star_test"] = False
+        result["concentricity"] = None
+        if self.concentricity:
+            centre = (
+                self.center_focus[0] + self.center_offset[0],
+                self.center_focus[1] + self.center_offset[1],
+            )
+            result["concentricity"] = self.profile.measure(
+                frame.image, frame.scale, centre
+            )
+        return result
+
+    def stop(self):
+        self.running = False
+        self._wake.set()
+        self.wait()
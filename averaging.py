@@ -0,0 +1,71 @@
+# Temporal frame averaging, to steady faint detail on a noisy sensor
+import cv2
+import numpy as np
+
+# Averaging modes offered by comboAverageMode
+MODES = ("mean", "ema")
+
+
+class FrameAverager:
+    """
+    Average of the last frames: a running mean of the last `count` frames
+    ("mean") or an exponential moving average with the same time constant
+    ("ema", alpha = 2 / (count + 1)). count <= 1 switches averaging off.
+
+    The float32 accumulator (and, for the running mean, a ring of the last
+    count frames) is allocated when the frame shape changes and then updated
+    in place with cv2.accumulate / cv2.accumulateWeighted, so steady-state
+    averaging does no per-frame allocations. A change of shape (resolution
+    or grayscale mode), count or mode restarts the average.
+    """
+
+    def __init__(self, count=1, mode="mean"):
+        self.count = count
+        self.mode = mode
+        self.reset()
+
+    @property
+    def enabled(self):
+        return self.count > 1
+
+    def set_count(self, count):
+        if count != self.count:
+            self.count = count
+            self.reset()
+
+    def set_mode(self, mode):
+        if mode != self.mode:
+            self.mode = mode
+            self.reset()
+
+    def reset(self):
+        self.acc = None
+        self.history = None  # running mean: the frames in the average
+        self.filled = 0  # frames averaged since the reset
+
+    def add(self, image, out):
+        """
+        Add a uint8 frame and write the average into out (same shape and
+        type, may be image itself). Returns out.
+        """
+        if self.acc is None or self.acc.shape != image.shape:
+            self.reset()
+            self.acc = np.zeros(image.shape, np.float32)
+            if self.mode == "mean":
+                self.history = np.empty((self.count,) + image.shape, np.uint8)
+
+        if self.mode == "mean":
+            slot = self.history[self.filled % self.count]
+            if self.filled >= self.count:
+                cv2.subtract(self.acc, slot, dst=self.acc, dtype=cv2.CV_32F)
+            np.copyto(slot, image)
+            cv2.accumulate(image, self.acc)
+            self.filled += 1
+            weight = 1.0 / min(self.filled, self.count)
+        else:
+            self.filled += 1
+            # plain mean while filling, so the start is not biased to black
+            alpha = max(2.0 / (self.count + 1), 1.0 / self.filled)
+            cv2.accumulateWeighted(image, self.acc, alpha)
+            weight = 1.0
+        return cv2.convertScaleAbs(self.acc, dst=out, alpha=weight)
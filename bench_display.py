@@ -0,0 +1,119 @@
+"""Benchmark of the per-paint frame display path of VideoWindow
+
+Compares the colour-converting RGB888 path with the zero-copy BGR888 wrap,
+both on the full frame and on the zoom viewport, and reports time and the
+bytes allocated per paint (numpy/OpenCV buffers, measured with tracemalloc).
+
+With --window it instead times full VideoWindow repaints with a new frame
+on every paint and all overlays visible, i.e. the full frame rate case.
+"""
+
+import argparse, time, tracemalloc
+import cv2
+import numpy as np
+from PyQt6.QtWidgets import QApplication
+from PyQt6.QtGui import QImage, QPainter
+
+from videowindow import bgr_to_qimage, resize_for_display
+
+
+def make_frame(width, height):
+    frame = np.random.default_rng(0).integers(0, 256, (height, width, 3), np.uint8)
+    cv2.circle(frame, (width // 2, height // 2), height // 3, (255, 255, 255), 20)
+    return frame
+
+
+def paint_rgb_copy(target, image):
+    rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    h, w = rgb_image.shape[:2]
+    qimg = QImage(
+        rgb_image.data, w, h, rgb_image.strides[0], QImage.Format.Format_RGB888
+    )
+    painter = QPainter(target)
+    painter.drawImage(0, 0, qimg)
+    painter.end()
+
+
+def paint_bgr_wrap(target, image):
+    qimg, _buffer = bgr_to_qimage(image)
+    painter = QPainter(target)
+    painter.drawImage(0, 0, qimg)
+    painter.end()
+
+
+def measure(paint, target, image, repeat):
+    paint(target, image)  # warm up
+    tracemalloc.start()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        tracemalloc.reset_peak()
+        paint(target, image)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed / repeat * 1000.0, peak
+
+
+def bench_window(frame, zoom, repeat):
+    from videowindow import VideoWindow
+
+    app = QApplication.instance() or QApplication([])
+    window = VideoWindow()
+    window.set_center_focus(frame.shape[1] / 2, frame.shape[0] / 2)
+    for index in range(3):
+        window.set_circle_property(index, "visible", True)
+    window.set_cross_property("visible", True)
+    window.set_cross_property("angle", 30)
+    window.zoom_factor = zoom
+    window.show()
+    app.processEvents()
+
+    # two distinct frames so every paint sees a new one
+    frames = (frame, np.ascontiguousarray(frame[::-1]))
+    window.set_frame(frames[1])
+    window.repaint()
+    start = time.perf_counter()
+    for i in range(repeat):
+        window.set_frame(frames[i % 2])
+        window.repaint()
+    ms = (time.perf_counter() - start) / repeat * 1000.0
+    window.close()
+    return ms
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--width", type=int, default=3264)
+    parser.add_argument("--height", type=int, default=2448)
+    parser.add_argument("--zoom", type=float, default=0.39)
+    parser.add_argument("--repeat", type=int, default=30)
+    parser.add_argument("--window", action="store_true")
+    args = parser.parse_args()
+
+    frame = make_frame(args.width, args.height)
+    if args.window:
+        ms = bench_window(frame, args.zoom, args.repeat)
+        print(f"VideoWindow repaint, new frame each paint: {ms:.2f} ms/paint")
+        raise SystemExit
+    viewport = resize_for_display(
+        frame,
+        int(args.width * args.zoom),
+        int(args.height * args.zoom),
+        args.zoom,
+    )
+    target = QImage(args.width, args.height, QImage.Format.Format_RGB32)
+
+    print(
+        f"Frame {args.width}x{args.height}, viewport {viewport.shape[1]}x{viewport.shape[0]}"
+    )
+    print(f"{'path':<28}{'ms/paint':>10}{'MB alloc/paint':>16}")
+    for name, paint, image in (
+        ("cvtColor RGB888, full", paint_rgb_copy, frame),
+        ("BGR888 wrap, full", paint_bgr_wrap, frame),
+        ("cvtColor RGB888, viewport", paint_rgb_copy, viewport),
+        ("BGR888 wrap, viewport", paint_bgr_wrap, viewport),
+    ):
+        ms, peak = measure(paint, target, image, args.repeat)
+        print(f"{name:<28}{ms:>10.2f}{peak / 1e6:>16.2f}")
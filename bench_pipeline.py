@@ -0,0 +1,217 @@
+"""End-to-end latency and throughput benchmark of the capture/display pipeline
+
+Runs the real MainWindow and VideoWindow headless (Qt offscreen platform)
+on a synthetic or replayed source and reports, as JSON:
+  capture and displayed FPS, dropped frames, glass-to-paint latency
+  percentiles (source read to first paint), CPU time per frame, peak RSS,
+  minor page faults per frame.
+"""
+
+import argparse, json, os, platform, sys, time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import numpy as np
+from PyQt6 import uic
+from PyQt6.QtCore import QTimer
+from PyQt6.QtWidgets import QApplication
+
+from averaging import MODES as AVERAGE_MODES
+from framesource import ReplaySource, SyntheticSource
+from instrumentation import pipeline_stats
+from mainwindow import DISPLAY_FPS_CHOICES, MainWindow
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def cpu_seconds():
+    """
+    CPU time of this process and of its terminated children (the capture
+    process, once joined). Falls back to this process only on Windows.
+    """
+    if resource is None:
+        return time.process_time(), False
+    total = 0.0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        usage = resource.getrusage(who)
+        total += usage.ru_utime + usage.ru_stime
+    return total, True
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = 0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        peak = max(peak, resource.getrusage(who).ru_maxrss)
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if platform.system() == "Darwin" else 1024), 1)
+
+
+def minor_faults():
+    """Minor page faults so far, a proxy for large allocations being paged in."""
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_minflt
+
+
+def percentiles(values, points=(50, 95, 99)):
+    if not values:
+        return {f"p{p}": None for p in points}
+    result = np.percentile(np.array(values) * 1000.0, points)
+    return {f"p{p}": round(float(v), 2) for p, v in zip(points, result)}
+
+
+def run(args):
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    here = os.path.dirname(os.path.abspath(__file__))
+    os.chdir(here)  # focus.txt and the asset paths are relative
+
+    if args.source == "synthetic":
+        source = SyntheticSource(args.width, args.height, fps=args.fps)
+    else:
+        source = ReplaySource(args.source, realtime=args.fps > 0, fps=args.fps)
+
+    ui = uic.loadUi(os.path.join(here, "ui", "mainwindow.ui"))
+    window = MainWindow(ui)
+    window.frame_source = source
+    window.reduced_decode = args.reduced
+    window.decode_workers = args.workers if args.mode == "pool" else 0
+    window.capture_process = args.mode == "process"
+    window.ui.checkBoxGrayscale.setChecked(args.grayscale)
+    window.ui.spinBoxAverage.setValue(args.average)
+    window.ui.comboAverageMode.setCurrentIndex(AVERAGE_MODES.index(args.average_mode))
+    if args.display_fps in DISPLAY_FPS_CHOICES:
+        window.ui.comboDisplayFps.setCurrentIndex(
+            DISPLAY_FPS_CHOICES.index(args.display_fps)
+        )
+
+    latencies = []
+    painted = 0
+    state = {"measuring": False}
+
+    def on_painted(frame_id, captured, painted_at):
+        nonlocal painted
+        if state["measuring"]:
+            painted += 1
+            latencies.append(painted_at - captured)
+
+    pipeline_stats.set_enabled(args.stages)
+    window.start_camera()
+    window.video_window.framePainted.connect(on_painted)
+    if args.zoom:
+        window.video_window.zoom_factor = args.zoom
+        window.camera_thread.set_display_zoom(args.zoom)
+
+    # warm up (source open, first frames), then measure
+    def start_measuring():
+        state["measuring"] = True
+        pipeline_stats.clear()
+        state["read0"] = window.camera_thread.frames_read
+        state["cpu0"] = cpu_seconds()[0]
+        state["faults0"] = minor_faults()
+        state["t0"] = time.perf_counter()
+
+    QTimer.singleShot(int(args.warmup * 1000), start_measuring)
+    QTimer.singleShot(int((args.warmup + args.duration) * 1000), app.quit)
+    app.exec()
+
+    elapsed = time.perf_counter() - state["t0"]
+    frames_read = window.camera_thread.frames_read - state["read0"]
+    mailbox = window.camera_thread.mailbox.stats()
+    repaints = window.video_window.repaint_stats()
+    window.stop_camera()
+    cpu, includes_children = cpu_seconds()
+    cpu -= state["cpu0"]
+    faults = minor_faults()
+    if faults is not None:
+        faults = round((faults - state["faults0"]) / max(1, frames_read), 1)
+
+    return {
+        "source": str(source),
+        "mode": args.mode,
+        "reduced_decode": args.reduced,
+        "grayscale": args.grayscale,
+        "average": args.average if args.average > 1 else None,
+        "average_mode": args.average_mode,
+        "display_fps_cap": args.display_fps,
+        "decode_workers": window.decode_workers,
+        "zoom": args.zoom or 0.39,
+        "duration_s": round(elapsed, 3),
+        "capture_fps": round(frames_read / elapsed, 2),
+        "displayed_fps": round(painted / elapsed, 2),
+        "frames_read": frames_read,
+        "frames_displayed": painted,
+        "frames_dropped": max(0, frames_read - painted),
+        "mailbox": mailbox,
+        "repaints": repaints,
+        "latency_ms": percentiles(latencies),
+        "stage_ms": (
+            {k: v and round(v, 2) for k, v in pipeline_stats.summary().items()}
+            if args.stages
+            else None
+        ),
+        "cpu_ms_per_frame": round(cpu / max(1, frames_read) * 1000.0, 2),
+        "cpu_includes_children": includes_children,
+        "peak_rss_mb": peak_rss_mb(),
+        "minor_faults_per_frame": faults,
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--source", default="synthetic", help="'synthetic' or a replay path"
+    )
+    parser.add_argument("--width", type=int, default=3264)
+    parser.add_argument("--height", type=int, default=2448)
+    parser.add_argument(
+        "--fps", type=float, default=30.0, help="source rate, 0 = as fast as possible"
+    )
+    parser.add_argument("--mode", choices=("direct", "pool", "process"), default="pool")
+    parser.add_argument(
+        "--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1)
+    )
+    parser.add_argument(
+        "--no-reduced",
+        dest="reduced",
+        action="store_false",
+        help="deliver decoded frames instead of JPEG buffers",
+    )
+    parser.add_argument(
+        "--grayscale", action="store_true", help="single-channel frames"
+    )
+    parser.add_argument(
+        "--average", type=int, default=1, help="average the last N frames, 1 = off"
+    )
+    parser.add_argument("--average-mode", choices=AVERAGE_MODES, default="mean")
+    parser.add_argument(
+        "--display-fps",
+        type=int,
+        default=0,
+        choices=DISPLAY_FPS_CHOICES,
+        help="repaint rate cap, 0 = display refresh rate",
+    )
+    parser.add_argument("--zoom", type=float, default=None)
+    parser.add_argument("--warmup", type=float, default=3.0)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument(
+        "--stages", action="store_true", help="also report mean ms per pipeline stage"
+    )
+    parser.add_argument("--output", help="write the JSON result to this file")
+    args = parser.parse_args()
+
+    result = run(args)
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
@@ -0,0 +1,154 @@
+# Dark frame and flat field calibration of the captured frames
+import os, threading
+import cv2
+import numpy as np
+
+# Masters live next to focus.txt, one .npy file each
+CALIBRATION_DIR = "calibration"
+DARK_FILE = "dark.npy"
+GAIN_FILE = "flat_gain.npy"
+
+# Flat gain fixed point: 128 is a gain of 1.0, 255 the largest (about 2x)
+GAIN_ONE = 128
+
+
+class MasterCapture:
+    """
+    Mean of the next count frames, for a master dark ("dark") or flat
+    ("flat"). add() returns True once enough frames are in; a change of
+    frame shape restarts the average.
+    """
+
+    def __init__(self, kind, count=16):
+        self.kind = kind
+        self.count = count
+        self.acc = None
+        self.added = 0
+
+    def add(self, image):
+        if self.acc is None or self.acc.shape != image.shape:
+            self.acc = np.zeros(image.shape, np.float32)
+            self.added = 0
+        cv2.accumulate(image, self.acc)
+        self.added += 1
+        return self.added >= self.count
+
+    def master(self):
+        return cv2.convertScaleAbs(self.acc, alpha=1.0 / self.added)
+
+
+class Calibration:
+    """
+    Master dark and flat gain, applied in place as (frame - dark) * gain.
+
+    The masters are stored at sensor resolution in the frame layout they
+    were captured in and loaded memory-mapped, so loading is instant and
+    pages are only read on first use. The gain is fixed point (GAIN_ONE =
+    1.0) so the multiply runs on 8 bit data. Frames decoded at reduced
+    resolution or in grayscale get maps resized/converted once per frame
+    shape and cached.
+    """
+
+    def __init__(self, dark=None, gain=None, directory=CALIBRATION_DIR):
+        self.dark = dark
+        self.gain = gain
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._maps = {}  # frame shape: (dark, gain), None if not applicable
+
+    @classmethod
+    def load(cls, directory=CALIBRATION_DIR):
+        masters = []
+        for name in (DARK_FILE, GAIN_FILE):
+            path = os.path.join(directory, name)
+            try:
+                masters.append(np.load(path, mmap_mode="r"))
+            except FileNotFoundError:
+                masters.append(None)
+            except (OSError, ValueError) as e:
+                print(f"Cannot load calibration {path}: {e}")
+                masters.append(None)
+        return cls(*masters, directory=directory)
+
+    def describe(self):
+        loaded = [
+            name
+            for name, master in (("dark", self.dark), ("flat", self.gain))
+            if master is not None
+        ]
+        return ", ".join(loaded) if loaded else "none"
+
+    # A new Calibration with this master dark, saved to disk
+    def with_dark(self, dark):
+        return Calibration(
+            self._save(DARK_FILE, dark), self.gain, directory=self.directory
+        )
+
+    # A new Calibration with the gain that flattens this master flat (dark
+    # subtracted first, if there is one), saved to disk
+    def with_flat(self, flat):
+        flat = flat.astype(np.float32)
+        dark = self._resample(self.dark, flat.shape)
+        if dark is not None:
+            flat = cv2.subtract(flat, dark, dtype=cv2.CV_32F)
+        flat = cv2.GaussianBlur(flat, (5, 5), 0)  # noise, not vignetting
+        level = flat.reshape(-1, flat.shape[2] if flat.ndim == 3 else 1).mean(axis=0)
+        gain = GAIN_ONE * level / np.maximum(flat, 1.0)
+        gain = np.clip(np.rint(gain), 0, 255).astype(np.uint8)
+        return Calibration(
+            self.dark, self._save(GAIN_FILE, gain), directory=self.directory
+        )
+
+    # Write a master next to the old one and swap it in, so frames still
+    # using the old memory map are not affected. Returns the master mapped
+    # from the new file.
+    def _save(self, name, master):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, name)
+        temporary = path + ".tmp"
+        with open(temporary, "wb") as f:
+            np.save(f, master)
+        os.replace(temporary, path)
+        return np.load(path, mmap_mode="r")
+
+    # A master resampled to the frame shape: resized for reduced decoding,
+    # converted for grayscale (or BGR) frames. None when the master does not
+    # fit, e.g. a different sensor aspect ratio.
+    @staticmethod
+    def _resample(master, shape):
+        if master is None:
+            return None
+        if master.shape == shape:
+            return master
+        h, w = shape[:2]
+        mh, mw = master.shape[:2]
+        if abs(mw * h - mh * w) > 0.01 * mw * h:
+            return None
+        master = np.asarray(master)
+        if master.ndim == 3 and len(shape) == 2:
+            master = cv2.cvtColor(master, cv2.COLOR_BGR2GRAY)
+        elif master.ndim == 2 and len(shape) == 3:
+            master = cv2.cvtColor(master, cv2.COLOR_GRAY2BGR)
+        if (mh, mw) != (h, w):
+            master = cv2.resize(master, (w, h), interpolation=cv2.INTER_AREA)
+        return master
+
+    def maps(self, shape):
+        with self._lock:
+            if shape not in self._maps:
+                dark = self._resample(self.dark, shape)
+                gain = self._resample(self.gain, shape)
+                if (self.dark is not None and dark is None) or (
+                    self.gain is not None and gain is None
+                ):
+                    print(f"Calibration masters do not fit {shape} frames")
+                self._maps[shape] = (dark, gain)
+            return self._maps[shape]
+
+    def apply(self, image):
+        """Calibrate a uint8 frame in place."""
+        dark, gain = self.maps(image.shape)
+        if dark is not None:
+            cv2.subtract(image, dark, dst=image)
+        if gain is not None:
+            cv2.multiply(image, gain, dst=image, scale=1.0 / GAIN_ONE)
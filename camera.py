@@ -1,30 +1,143 @@
 # Camera index finder for ocal2 camera
-import cv2, platform
+import cv2, glob, json, os, platform, re
 from cv2_enumerate_cameras import enumerate_cameras
 
+# The camera found last time, validated on the next start before falling
+# back to a full enumeration
+CAMERA_CACHE = "camera.json"
+
+# Persistent V4L2 links, one per USB video interface of each camera
+V4L_BY_ID = "/dev/v4l/by-id"
+
+# V4L2 name of the ocal2
+V4L2_NAME = "ocal2: ocal2"
+
+
+def _read_line(*path):
+    try:
+        with open(os.path.join(*path)) as f:
+            return f.readline().strip()
+    except OSError:
+        return None
+
+
+# Name of /dev/videoN from sysfs, None if there is no such device
+def _v4l2_name(index):
+    return _read_line(f"/sys/class/video4linux/video{index}", "name")
+
+
+# N of the /dev/videoN a by-id link points to, None if it is gone
+def _v4l2_index(link):
+    node = os.path.basename(os.path.realpath(link))
+    if not node.startswith("video") or not node[5:].isdigit():
+        return None
+    return int(node[5:])
+
+
+def _load_cache(cache):
+    try:
+        with open(cache) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        print(f"Cannot load camera cache {cache}: {e}")
+        return None
+
+
+def _save_cache(index, path=None, cache=CAMERA_CACHE):
+    entry = {
+        "platform": platform.system().lower(),
+        "index": index,
+        "path": path,
+        "identity": device_identity(index),
+    }
+    try:
+        with open(cache, "w") as f:
+            json.dump(entry, f, indent=1)
+    except OSError as e:
+        print(f"Cannot save camera cache {cache}: {e}")
+
+
+def forget_camera(cache=CAMERA_CACHE):
+    """Drop the cached camera, e.g. when it could not be opened."""
+    try:
+        os.remove(cache)
+    except FileNotFoundError:
+        pass
+
+
+def find_camera(cache=CAMERA_CACHE):
+    """
+    Index of the ocal2 without enumerating the cameras: the cached camera
+    if it is still there, else (Linux) the /dev/v4l/by-id link of its video
+    capture interface. Only sysfs and the links are read, no device is
+    opened. Returns None when a full enumeration is needed
+    (find_camera_index_by_name_substring).
+    """
+    platform_name = platform.system().lower()
+    entry = _load_cache(cache)
+    if entry is not None and entry.get("platform") == platform_name:
+        index = entry["index"]
+        if platform_name != "linux":
+            # nothing cheap to check against: a camera that does not open
+            # is forgotten (forget_camera) and enumerated next time
+            return index
+        if entry.get("path"):
+            index = _v4l2_index(entry["path"])
+            name = _v4l2_name(index) if index is not None else None
+            if name and V4L2_NAME in name:
+                if index != entry["index"]:
+                    _save_cache(index, entry["path"], cache)  # renumbered
+                return index
+        elif device_identity(index) == entry.get("identity"):
+            name = _v4l2_name(index)
+            if name and V4L2_NAME in name:
+                return index
+
+    if platform_name == "linux":
+        # index0 is the capture interface (index1 the metadata one)
+        for link in sorted(glob.glob(os.path.join(V4L_BY_ID, "*-video-index0"))):
+            index = _v4l2_index(link)
+            name = _v4l2_name(index) if index is not None else None
+            if name and V4L2_NAME in name:
+                print(f'Found camera with name "ocal2" at {link} (index {index})')
+                _save_cache(index, link, cache)
+                return index
+    return None
+
 
 def find_camera_index_by_name_substring():
     """
-    Find index of camera ocal2: ocal2.
+    Find index of camera ocal2: ocal2 by enumerating all cameras, which can
+    take seconds. The result is cached for find_camera.
     """
     platform_name = platform.system().lower()
-    target_name_linux = "ocal2: ocal2"
+    target_name_linux = V4L2_NAME
     target_name_windows = "ocal2"
     target_name_darwin = "ocal2"
 
     if platform_name == "linux":
         print("Using V4L2 backend for Linux cameras.")
+        # enumerate_cameras lists the /dev/video* nodes that can capture, in
+        # no particular order: take the lowest, the camera's first interface
+        found = []
         for camera_info in enumerate_cameras(cv2.CAP_V4L2):
             print(f"{camera_info.index}: {camera_info.name}")
             if target_name_linux in camera_info.name:
-                print(f'Found camera with name "ocal2" at index {camera_info.index}')
-                return camera_info.index - 1  # Adjusting index for V4L2 backend
+                found.append(camera_info.index)
+        if found:
+            index = min(found)
+            print(f'Found camera with name "ocal2" at index {index}')
+            _save_cache(index)
+            return index
     elif platform_name == "windows":
         print("Using MSMF backend for Windows cameras.")
         for camera_info in enumerate_cameras(cv2.CAP_DSHOW):
             print(f"{camera_info.index}: {camera_info.name}")
             if target_name_windows in camera_info.name:
                 print(f'Found camera with name "ocal2" at index {camera_info.index}')
+                _save_cache(camera_info.index)
                 return camera_info.index
     elif platform_name == "darwin":
         print("Using AVFoundation backend for macOS cameras.")
@@ -33,10 +146,75 @@ def find_camera_index_by_name_substring():
             if target_name_darwin in camera_info.name:
                 print(camera_info.name)
                 print(f'Found camera with name "ocal2" at index {camera_info.index}')
-            return camera_info.index
+                _save_cache(camera_info.index)
+                return camera_info.index
     else:
         raise RuntimeError(
             f"Unsupported platform: {platform_name}. Supported platforms are Linux, Windows, and partial Darwin."
         )
 
     return None
+
+
+def device_identity(camera_index):
+    """
+    Identity of a camera for the on-disk caches (capabilities), usable as a
+    file name. On Linux the USB vendor:product, serial and name of the V4L2
+    device from sysfs, so it does not change with the index. Elsewhere the
+    platform and index.
+    """
+    if platform.system().lower() == "linux":
+        node = f"/sys/class/video4linux/video{camera_index}"
+        usb = os.path.realpath(os.path.join(node, "device"))
+        if ":" in os.path.basename(usb):
+            usb = os.path.dirname(usb)  # interface, the device is its parent
+        vendor, product = _read_line(usb, "idVendor"), _read_line(usb, "idProduct")
+        if vendor and product:
+            serial, name = _read_line(usb, "serial"), _read_line(node, "name")
+            parts = [f"{vendor}_{product}", serial, name]
+            identity = "-".join(part for part in parts if part)
+            return re.sub(r"[^\w.-]+", "_", identity)
+    return f"{platform.system().lower()}-{camera_index}"
+
+
+def camera_device(camera_index):
+    """The V4L2 device node of a camera index on Linux, else None."""
+    if platform.system().lower() == "linux":
+        return f"/dev/video{camera_index}"
+    return None
+
+
+def open_camera(camera_index, reduced_decode=False, fourcc="MJPG", size=None, fps=None):
+    """
+    Open the camera with the backend for this platform, by default MJPEG at
+    3264x2448 (the capture format from the device capabilities once they
+    are cached). With reduced_decode the backend is asked for the undecoded
+    MJPEG buffers.
+    """
+    # select the appropriate backend based on the platform
+    platform_name = platform.system().lower()
+    print(f"Running on platform: {platform_name}")
+    if platform_name == "windows":
+        cap = cv2.VideoCapture(camera_index, cv2.CAP_DSHOW)
+        cap.set(cv2.CAP_PROP_AUTO_EXPOSURE, 0.25)  # Set manual exposure
+        cap.set(cv2.CAP_PROP_EXPOSURE, -4)  # Set exposure to a reasonable value
+    elif platform_name == "darwin":
+        cap = cv2.VideoCapture(0)
+        print("Using default backend for macOS")
+    elif platform_name == "linux":
+        cap = cv2.VideoCapture(camera_index, cv2.CAP_V4L2)
+    else:
+        raise RuntimeError(f"Unsupported platform: {platform_name}")
+
+    # Set codec and resolution
+    width, height = size or (3264, 2448)
+    cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter.fourcc(*fourcc))
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+    if fps:
+        cap.set(cv2.CAP_PROP_FPS, fps)
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 3)  # Set buffer size to 1 for low latency
+    if reduced_decode and fourcc == "MJPG":
+        # Ask the backend for the undecoded MJPEG buffers
+        cap.set(cv2.CAP_PROP_CONVERT_RGB, 0)
+    return cap
@@ -1,12 +1,54 @@
+from collections import deque
 from PyQt6 import uic
-from PyQt6.QtWidgets import QDialog
-from PyQt6.QtGui import QIcon
+from PyQt6.QtCore import QPointF
+from PyQt6.QtWidgets import QDialog, QWidget
+from PyQt6.QtGui import QIcon, QPainter, QPen, QColor, QPolygonF
 import cv2
 import platform
 
+from capabilities import DEFAULT_RANGES, PROPERTY_NAMES
+from focus import FocusSweep
+
+
+class Sparkline(QWidget):
+    """The last values as a line, scaled from their minimum to maximum."""
+
+    def __init__(self, parent=None, length=120):
+        super().__init__(parent)
+        self.values = deque(maxlen=length)
+        self.setMinimumSize(120, 24)
+
+    def add(self, value):
+        self.values.append(value)
+        self.update()
+
+    def clear(self):
+        self.values.clear()
+        self.update()
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor(30, 30, 30))
+        if len(self.values) < 2:
+            return
+        low, high = min(self.values), max(self.values)
+        span = (high - low) or 1.0
+        w, h = self.width() - 1, self.height() - 3
+        step = w / (self.values.maxlen - 1)
+        x0 = w - step * (len(self.values) - 1)
+        line = QPolygonF(
+            [
+                QPointF(x0 + i * step, 1 + h * (high - v) / span)
+                for i, v in enumerate(self.values)
+            ]
+        )
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        painter.setPen(QPen(QColor(0, 220, 0), 1))
+        painter.drawPolyline(line)
+
 
 class CameraControlsDialog(QDialog):
-    def __init__(self, camera_thread, parent=None):
+    def __init__(self, camera_thread, parent=None, center_focus=None):
         super().__init__(parent)
         uic.loadUi("ui/cameracontrols.ui", self)
         self.setWindowTitle("Camera settings")
@@ -18,10 +60,6 @@ class CameraControlsDialog(QDialog):
         self.pushButton_close.clicked.connect(self.close_dialog)
 
         # Brightness
-        self.slider_Brightness.setRange(-64, 64)
-        self.slider_Brightness.setValue(self.safe_get(cv2.CAP_PROP_BRIGHTNESS))
-        self.lbl_brightness.setText(str(self.slider_Brightness.value()))
-
         self.slider_Brightness.valueChanged.connect(
             lambda v: (
                 self.set_property(cv2.CAP_PROP_BRIGHTNESS, v),
@@ -30,9 +68,6 @@ class CameraControlsDialog(QDialog):
         )
 
         # Contrast
-        self.slider_Contrast.setRange(0, 100)
-        self.slider_Contrast.setValue(self.safe_get(cv2.CAP_PROP_CONTRAST))
-        self.lbl_contrast.setText(str(self.slider_Contrast.value()))
         self.slider_Contrast.valueChanged.connect(
             lambda v: (
                 self.set_property(cv2.CAP_PROP_CONTRAST, v),
@@ -41,9 +76,6 @@ class CameraControlsDialog(QDialog):
         )
 
         # Focus
-        self.slider_Focus.setRange(0, 1023)
-        self.slider_Focus.setValue(self.safe_get(cv2.CAP_PROP_FOCUS))
-        self.lbl_focus.setText(str(self.slider_Focus.value()))
         self.slider_Focus.valueChanged.connect(
             lambda v: (
                 self.set_property(cv2.CAP_PROP_FOCUS, v),
@@ -51,10 +83,22 @@ class CameraControlsDialog(QDialog):
             )
         )
 
+        # Focus metric: sharpness of the ROI around center_focus while the
+        # dialog is open, and the focus sweep
+        self.center_focus = center_focus
+        self.sparkline = Sparkline(self)
+        self.gridLayout.addWidget(self.sparkline, 9, 1)
+        self.spinBox_focus_roi.valueChanged.connect(self.update_focus_roi)
+        self.pushButton_focus_sweep.clicked.connect(self.start_focus_sweep)
+        self.pushButton_focus_sweep.setEnabled(
+            bool(camera_thread and camera_thread.cap)
+            and center_focus is not None
+            and self.supports(cv2.CAP_PROP_FOCUS)
+        )
+        if camera_thread:
+            camera_thread.focusSweepDone.connect(self.focus_sweep_done)
+
         # Saturation
-        self.slider_Saturation.setRange(0, 100)
-        self.slider_Saturation.setValue(self.safe_get(cv2.CAP_PROP_SATURATION))
-        self.lbl_saturation.setText(str(self.slider_Saturation.value()))
         self.slider_Saturation.valueChanged.connect(
             lambda v: (
                 self.set_property(cv2.CAP_PROP_SATURATION, v),
@@ -63,9 +107,6 @@ class CameraControlsDialog(QDialog):
         )
 
         # Hue
-        self.slider_HUE.setRange(-180, 180)
-        self.slider_HUE.setValue(self.safe_get(cv2.CAP_PROP_HUE))
-        self.lbl_hue.setText(str(self.slider_HUE.value()))
         self.slider_HUE.valueChanged.connect(
             lambda v: (
                 self.set_property(cv2.CAP_PROP_HUE, v),
@@ -75,18 +116,11 @@ class CameraControlsDialog(QDialog):
 
         # Exposure
         if self.is_windows:
-            self.slider_Exposure.setRange(
-                -80, 0
-            )  # Typical Windows -13 to 0 (log scale) OCAL camera ma -8.0
-            init_val = int(self.safe_get(cv2.CAP_PROP_EXPOSURE) * 10)
-            self.slider_Exposure.valueChanged.connect(self.update_exposure)
-            self.slider_Exposure.setValue(init_val)
-            self.lbl_exposure.setText(f"{init_val / 10.0:.1f}")
+            # Typical Windows -13 to 0 (log scale) OCAL camera ma -8.0, the
+            # slider is in tenths
             self.slider_Exposure.valueChanged.connect(self.update_exposure)
         else:
-            self.slider_Exposure.setRange(1, 10000)  # Linux (e.g. microseconds)
-            self.slider_Exposure.setValue(self.safe_get(cv2.CAP_PROP_EXPOSURE))
-            self.lbl_exposure.setText(f"{self.slider_Exposure.value() / 10.0:.1f}")
+            # Linux (e.g. microseconds)
             self.slider_Exposure.valueChanged.connect(
                 lambda v: (
                     self.set_property(cv2.CAP_PROP_EXPOSURE, v),
@@ -95,9 +129,6 @@ class CameraControlsDialog(QDialog):
             )
 
         # Gamma
-        self.slider_Gamma.setRange(100, 500)
-        self.slider_Gamma.setValue(self.safe_get(cv2.CAP_PROP_GAMMA))
-        self.lbl_gamma.setText(str(self.slider_Gamma.value()))
         self.slider_Gamma.valueChanged.connect(
             lambda v: (
                 self.set_property(cv2.CAP_PROP_GAMMA, v),
@@ -106,9 +137,6 @@ class CameraControlsDialog(QDialog):
         )
 
         # Color temperature
-        self.slider_Colortemp.setRange(2800, 6500)
-        self.slider_Colortemp.setValue(self.safe_get(cv2.CAP_PROP_TEMPERATURE))
-        self.lbl_color_temp.setText(str(self.slider_Colortemp.value()))
         self.slider_Colortemp.valueChanged.connect(
             lambda v: (
                 self.set_property(cv2.CAP_PROP_TEMPERATURE, v),
@@ -117,9 +145,6 @@ class CameraControlsDialog(QDialog):
         )
 
         # Sharpness
-        self.slider_sharpness.setRange(0, 100)
-        self.slider_sharpness.setValue(self.safe_get(cv2.CAP_PROP_SHARPNESS))
-        self.lbl_sharpness.setText(str(self.slider_sharpness.value()))
         self.slider_sharpness.valueChanged.connect(
             lambda v: (
                 self.set_property(cv2.CAP_PROP_SHARPNESS, v),
@@ -127,67 +152,204 @@ class CameraControlsDialog(QDialog):
             )
         )
 
-        # Auto Focus
-        autofocus = bool(self.get_property(cv2.CAP_PROP_AUTOFOCUS))
-        self.checkBox_Auto_Focus.setChecked(autofocus)
-        self.handle_auto_focus(int(autofocus))
+        # Auto Focus, Auto Exposure, Auto White Balance
         self.checkBox_Auto_Focus.stateChanged.connect(self.handle_auto_focus)
-
-        # Auto Exposure
-        ae_value = self.get_property(cv2.CAP_PROP_AUTO_EXPOSURE)
-        is_auto_expo = ae_value >= 0.5
-        self.checkBox_Auto_Exposure.setChecked(is_auto_expo)
-        self.handle_auto_exposure(is_auto_expo)
         self.checkBox_Auto_Exposure.stateChanged.connect(self.handle_auto_exposure)
-
-        # Auto White Balance
-        wb_auto = bool(self.get_property(cv2.CAP_PROP_AUTO_WB))
-        self.checkBox_Auto_Wbalance.setChecked(wb_auto)
-        self.handle_auto_whitebalance(int(wb_auto))
         self.checkBox_Auto_Wbalance.stateChanged.connect(self.handle_auto_whitebalance)
 
+        # The capture thread owns the device: changes are queued to it and
+        # the values it reads back arrive with propertiesRead, starting with
+        # the current settings
+        self.sliders = {
+            cv2.CAP_PROP_BRIGHTNESS: (self.slider_Brightness, self.lbl_brightness),
+            cv2.CAP_PROP_CONTRAST: (self.slider_Contrast, self.lbl_contrast),
+            cv2.CAP_PROP_FOCUS: (self.slider_Focus, self.lbl_focus),
+            cv2.CAP_PROP_SATURATION: (self.slider_Saturation, self.lbl_saturation),
+            cv2.CAP_PROP_HUE: (self.slider_HUE, self.lbl_hue),
+            cv2.CAP_PROP_EXPOSURE: (self.slider_Exposure, self.lbl_exposure),
+            cv2.CAP_PROP_GAMMA: (self.slider_Gamma, self.lbl_gamma),
+            cv2.CAP_PROP_TEMPERATURE: (self.slider_Colortemp, self.lbl_color_temp),
+            cv2.CAP_PROP_SHARPNESS: (self.slider_sharpness, self.lbl_sharpness),
+        }
+        self.requested = {}  # prop: last value sent to the capture thread
+        self.automatic = {
+            cv2.CAP_PROP_AUTOFOCUS: self.checkBox_Auto_Focus,
+            cv2.CAP_PROP_AUTO_EXPOSURE: self.checkBox_Auto_Exposure,
+            cv2.CAP_PROP_AUTO_WB: self.checkBox_Auto_Wbalance,
+        }
+
+        # Ranges, supported controls and the last known values come from the
+        # device capabilities, so the dialog opens without a device call
+        capabilities = camera_thread.capabilities if camera_thread else None
+        for prop, (slider, label) in self.sliders.items():
+            name = PROPERTY_NAMES[prop]
+            low, high = (
+                capabilities.range(name) if capabilities else DEFAULT_RANGES[name]
+            )
+            if prop == cv2.CAP_PROP_EXPOSURE and self.is_windows:
+                low, high = low * 10, high * 10
+            slider.blockSignals(True)
+            slider.setRange(int(low), int(high))
+            slider.blockSignals(False)
+            if not self.supports(prop):
+                slider.setEnabled(False)
+                label.setText("n/a")
+        for prop, checkbox in self.automatic.items():
+            checkbox.setEnabled(self.supports(prop))
+        if capabilities:
+            for prop in (*self.sliders, *self.automatic):
+                value = capabilities.value(PROPERTY_NAMES[prop])
+                if value is not None:
+                    self.show_property(prop, value)
+
+        if camera_thread:
+            camera_thread.propertiesRead.connect(self.properties_read)
+            camera_thread.read_properties(
+                [
+                    prop
+                    for prop in (*self.sliders, *self.automatic)
+                    if self.supports(prop)
+                ]
+            )
+
     def close_dialog(self):
         self.close()
 
+    def showEvent(self, event):
+        self.update_focus_roi()
+        super().showEvent(event)
+
+    # Also reached through Esc (reject) and close(), which hide the dialog
+    def hideEvent(self, event):
+        if self.camera_thread:
+            self.camera_thread.set_focus_roi(None)
+        super().hideEvent(event)
+
+    def update_focus_roi(self):
+        if self.camera_thread and self.center_focus is not None:
+            self.camera_thread.set_focus_roi(
+                self.center_focus, self.spinBox_focus_roi.value()
+            )
+            self.sparkline.clear()
+
+    # Called by the main window with the sharpness of each displayed frame
+    def add_sharpness(self, value):
+        self.sparkline.add(value)
+        self.lbl_focus_metric.setText(f"{value:.0f}")
+
+    def start_focus_sweep(self):
+        self.checkBox_Auto_Focus.setChecked(False)
+        self.slider_Focus.setEnabled(False)
+        self.pushButton_focus_sweep.setEnabled(False)
+        self.pushButton_focus_sweep.setText("Sweeping")
+        # over the range the focus control reports
+        capabilities = self.camera_thread.capabilities
+        if capabilities:
+            low, high = capabilities.range("focus")
+        else:
+            low, high = DEFAULT_RANGES["focus"]
+        self.camera_thread.start_focus_sweep(FocusSweep(low, high))
+
+    # The camera thread has already moved the focus to the peak
+    def focus_sweep_done(self, sweep):
+        print(f"Focus sweep: peak at {sweep.best} ({len(sweep.scores)} positions)")
+        self.slider_Focus.blockSignals(True)
+        self.slider_Focus.setValue(sweep.best)
+        self.slider_Focus.blockSignals(False)
+        self.lbl_focus.setText(str(sweep.best))
+        self.slider_Focus.setEnabled(not self.checkBox_Auto_Focus.isChecked())
+        self.pushButton_focus_sweep.setEnabled(True)
+        self.pushButton_focus_sweep.setText("Sweep")
+
+    def supports(self, prop):
+        capabilities = self.camera_thread.capabilities if self.camera_thread else None
+        return capabilities is None or capabilities.supports(prop)
+
     def set_property(self, prop, val):
-        if self.camera_thread and self.camera_thread.cap:
-            self.camera_thread.cap.set(prop, float(val))
-            new_val = self.get_property(prop)
-            print(f"Updated {prop} to {new_val}")
-
-    def get_property(self, prop):
-        if self.camera_thread and self.camera_thread.cap:
-            return self.camera_thread.cap.get(prop)
-        return 0
-
-    def safe_get(self, prop):
-        """Get numeric property value. Accept negative for exposure (Windows)."""
-        try:
-            val = self.get_property(prop)
+        if self.camera_thread:
+            self.requested[prop] = val
+            self.camera_thread.set_property(prop, val)
+
+    # Values read back by the capture thread. A value for a write that has
+    # since been superseded is skipped, so a slider being dragged does not
+    # jump back to where it was a frame ago.
+    def properties_read(self, writes, values):
+        for prop, value in values.items():
+            if prop in writes:
+                if writes[prop] != self.requested.get(prop):
+                    continue
+                print(f"Updated {prop} to {value}")
+            self.show_property(prop, value)
+
+    # Show a device value without writing it back
+    def show_property(self, prop, value):
+        if prop == cv2.CAP_PROP_AUTOFOCUS:
+            self.checkBox_Auto_Focus.blockSignals(True)
+            self.checkBox_Auto_Focus.setChecked(bool(value))
+            self.checkBox_Auto_Focus.blockSignals(False)
+            self.slider_Focus.setEnabled(
+                not value and self.supports(cv2.CAP_PROP_FOCUS)
+            )
+        elif prop == cv2.CAP_PROP_AUTO_EXPOSURE:
+            # 0.25 = manual, 0.75 = auto (Windows-style)
+            self.checkBox_Auto_Exposure.blockSignals(True)
+            self.checkBox_Auto_Exposure.setChecked(value >= 0.5)
+            self.checkBox_Auto_Exposure.blockSignals(False)
+            self.slider_Exposure.setEnabled(
+                value < 0.5 and self.supports(cv2.CAP_PROP_EXPOSURE)
+            )
+        elif prop == cv2.CAP_PROP_AUTO_WB:
+            self.checkBox_Auto_Wbalance.blockSignals(True)
+            self.checkBox_Auto_Wbalance.setChecked(bool(value))
+            self.checkBox_Auto_Wbalance.blockSignals(False)
+            self.slider_Colortemp.setEnabled(
+                not value and self.supports(cv2.CAP_PROP_TEMPERATURE)
+            )
+            self.lbl_color_temp.setText(
+                "Auto" if value else str(self.slider_Colortemp.value())
+            )
+        elif prop in self.sliders:
+            slider, label = self.sliders[prop]
             if prop == cv2.CAP_PROP_EXPOSURE:
-                return int(val)  # Accept negative on Windows
-            return int(val) if val >= 0 else 0
-        except:
-            return 0
+                # Accept negative on Windows (log scale, slider in tenths)
+                position = round(value * 10) if self.is_windows else int(value)
+                text = f"{value:.1f}"
+            else:
+                position = int(value)
+                text = str(position)
+            if not slider.isSliderDown():
+                slider.blockSignals(True)
+                slider.setValue(position)
+                slider.blockSignals(False)
+            if not (
+                prop == cv2.CAP_PROP_TEMPERATURE
+                and self.checkBox_Auto_Wbalance.isChecked()
+            ):
+                label.setText(text)
 
     def handle_auto_focus(self, state):
         self.set_property(cv2.CAP_PROP_AUTOFOCUS, state)
-        self.slider_Focus.setEnabled(state == 0)
+        self.slider_Focus.setEnabled(state == 0 and self.supports(cv2.CAP_PROP_FOCUS))
 
     def handle_auto_exposure(self, state):
         # 0.25 = manual, 0.75 = auto (Windows-style)
         val = 0.75 if state else 0.25
         self.set_property(cv2.CAP_PROP_AUTO_EXPOSURE, val)
-        self.slider_Exposure.setEnabled(state == 0)
+        self.slider_Exposure.setEnabled(
+            state == 0 and self.supports(cv2.CAP_PROP_EXPOSURE)
+        )
 
     def handle_auto_whitebalance(self, state):
         self.set_property(cv2.CAP_PROP_AUTO_WB, state)
         self.lbl_color_temp.setText(
             "Auto" if state else str(self.slider_Colortemp.value())
         )
-        self.slider_Colortemp.setEnabled(state == 0)
+        self.slider_Colortemp.setEnabled(
+            state == 0 and self.supports(cv2.CAP_PROP_TEMPERATURE)
+        )
 
     def update_exposure(self, val):
         real_val = val / 10.0
         self.set_property(cv2.CAP_PROP_EXPOSURE, real_val)
+        self.lbl_exposure.setText(f"{real_val:.1f}")
         print(f"EXPOSURE {real_val}")
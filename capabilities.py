@@ -0,0 +1,340 @@
+# Camera capability probe: supported controls with their ranges, frame formats,
+# sizes and rates, probed once per device and cached on disk
+import ctypes, json, os, platform
+import cv2
+
+# One JSON file per device identity (camera.device_identity)
+CAPABILITY_DIR = "capabilities"
+
+V4L2_CID_BASE = 0x00980900
+V4L2_CID_CAMERA_CLASS_BASE = 0x009A0900
+
+# Camera controls: name: (VideoCapture property, V4L2 control id)
+CONTROLS = {
+    "brightness": (cv2.CAP_PROP_BRIGHTNESS, V4L2_CID_BASE + 0),
+    "contrast": (cv2.CAP_PROP_CONTRAST, V4L2_CID_BASE + 1),
+    "saturation": (cv2.CAP_PROP_SATURATION, V4L2_CID_BASE + 2),
+    "hue": (cv2.CAP_PROP_HUE, V4L2_CID_BASE + 3),
+    "auto_wb": (cv2.CAP_PROP_AUTO_WB, V4L2_CID_BASE + 12),
+    "gamma": (cv2.CAP_PROP_GAMMA, V4L2_CID_BASE + 16),
+    "gain": (cv2.CAP_PROP_GAIN, V4L2_CID_BASE + 19),
+    "temperature": (cv2.CAP_PROP_TEMPERATURE, V4L2_CID_BASE + 26),
+    "sharpness": (cv2.CAP_PROP_SHARPNESS, V4L2_CID_BASE + 27),
+    "auto_exposure": (cv2.CAP_PROP_AUTO_EXPOSURE, V4L2_CID_CAMERA_CLASS_BASE + 1),
+    "exposure": (cv2.CAP_PROP_EXPOSURE, V4L2_CID_CAMERA_CLASS_BASE + 2),
+    "focus": (cv2.CAP_PROP_FOCUS, V4L2_CID_CAMERA_CLASS_BASE + 10),
+    "autofocus": (cv2.CAP_PROP_AUTOFOCUS, V4L2_CID_CAMERA_CLASS_BASE + 12),
+    "zoom": (cv2.CAP_PROP_ZOOM, V4L2_CID_CAMERA_CLASS_BASE + 13),
+}
+
+# Ranges for backends that cannot report them (what the settings dialog used)
+DEFAULT_RANGES = {
+    "brightness": (-64, 64),
+    "contrast": (0, 100),
+    "saturation": (0, 100),
+    "hue": (-180, 180),
+    "auto_wb": (0, 1),
+    "gamma": (100, 500),
+    "gain": (0, 100),
+    "temperature": (2800, 6500),
+    "sharpness": (0, 100),
+    "auto_exposure": (0, 1),
+    "exposure": (-8, 0) if platform.system() == "Windows" else (1, 10000),
+    "focus": (0, 1023),
+    "autofocus": (0, 1),
+    "zoom": (100, 500),
+}
+
+
+# V4L2 structures and ioctls (videodev2.h)
+class v4l2_queryctrl(ctypes.Structure):
+    _fields_ = [
+        ("id", ctypes.c_uint32),
+        ("type", ctypes.c_uint32),
+        ("name", ctypes.c_char * 32),
+        ("minimum", ctypes.c_int32),
+        ("maximum", ctypes.c_int32),
+        ("step", ctypes.c_int32),
+        ("default_value", ctypes.c_int32),
+        ("flags", ctypes.c_uint32),
+        ("reserved", ctypes.c_uint32 * 2),
+    ]
+
+
+class v4l2_control(ctypes.Structure):
+    _fields_ = [("id", ctypes.c_uint32), ("value", ctypes.c_int32)]
+
+
+class v4l2_fmtdesc(ctypes.Structure):
+    _fields_ = [
+        ("index", ctypes.c_uint32),
+        ("type", ctypes.c_uint32),
+        ("flags", ctypes.c_uint32),
+        ("description", ctypes.c_char * 32),
+        ("pixelformat", ctypes.c_uint32),
+        ("mbus_code", ctypes.c_uint32),
+        ("reserved", ctypes.c_uint32 * 3),
+    ]
+
+
+class v4l2_frmsizeenum(ctypes.Structure):
+    # discrete sizes only: width, height, then the rest of the stepwise union
+    _fields_ = [
+        ("index", ctypes.c_uint32),
+        ("pixel_format", ctypes.c_uint32),
+        ("type", ctypes.c_uint32),
+        ("width", ctypes.c_uint32),
+        ("height", ctypes.c_uint32),
+        ("stepwise", ctypes.c_uint32 * 4),
+        ("reserved", ctypes.c_uint32 * 2),
+    ]
+
+
+class v4l2_frmivalenum(ctypes.Structure):
+    # discrete intervals only: numerator, denominator, then the rest of the union
+    _fields_ = [
+        ("index", ctypes.c_uint32),
+        ("pixel_format", ctypes.c_uint32),
+        ("width", ctypes.c_uint32),
+        ("height", ctypes.c_uint32),
+        ("type", ctypes.c_uint32),
+        ("numerator", ctypes.c_uint32),
+        ("denominator", ctypes.c_uint32),
+        ("stepwise", ctypes.c_uint32 * 4),
+        ("reserved", ctypes.c_uint32 * 2),
+    ]
+
+
+def _iowr(number, structure):
+    return (3 << 30) | (ctypes.sizeof(structure) << 16) | (ord("V") << 8) | number
+
+
+VIDIOC_ENUM_FMT = _iowr(2, v4l2_fmtdesc)
+VIDIOC_G_CTRL = _iowr(27, v4l2_control)
+VIDIOC_QUERYCTRL = _iowr(36, v4l2_queryctrl)
+VIDIOC_ENUM_FRAMESIZES = _iowr(74, v4l2_frmsizeenum)
+VIDIOC_ENUM_FRAMEINTERVALS = _iowr(75, v4l2_frmivalenum)
+V4L2_BUF_TYPE_VIDEO_CAPTURE = 1
+V4L2_CTRL_FLAG_DISABLED = 0x0001
+V4L2_FRMSIZE_TYPE_DISCRETE = 1
+V4L2_FRMIVAL_TYPE_DISCRETE = 1
+
+
+def _fourcc(code):
+    return "".join(chr((code >> (8 * i)) & 0xFF) for i in range(4))
+
+
+# Every index the V4L2 enumeration ioctl accepts, until it fails
+def _enumerate(fd, request, structure, **fields):
+    import fcntl  # Unix only, the V4L2 probe only runs on Linux
+
+    index = 0
+    while True:
+        entry = structure(index=index, **fields)
+        try:
+            fcntl.ioctl(fd, request, entry)
+        except OSError:
+            return
+        yield entry
+        index += 1
+
+
+def _probe_v4l2(device):
+    import fcntl  # Unix only
+
+    controls, formats = {}, {}
+    fd = os.open(device, os.O_RDWR | os.O_NONBLOCK)
+    try:
+        for name, (_, cid) in CONTROLS.items():
+            query = v4l2_queryctrl(id=cid)
+            try:
+                fcntl.ioctl(fd, VIDIOC_QUERYCTRL, query)
+            except OSError:
+                continue  # not a control of this device
+            if query.flags & V4L2_CTRL_FLAG_DISABLED:
+                continue
+            control = v4l2_control(id=cid)
+            try:
+                fcntl.ioctl(fd, VIDIOC_G_CTRL, control)
+                value = control.value
+            except OSError:
+                value = query.default_value
+            controls[name] = {
+                "min": query.minimum,
+                "max": query.maximum,
+                "step": query.step,
+                "default": query.default_value,
+                "value": value,
+            }
+        for fmt in _enumerate(
+            fd, VIDIOC_ENUM_FMT, v4l2_fmtdesc, type=V4L2_BUF_TYPE_VIDEO_CAPTURE
+        ):
+            sizes = formats.setdefault(_fourcc(fmt.pixelformat), {})
+            for size in _enumerate(
+                fd,
+                VIDIOC_ENUM_FRAMESIZES,
+                v4l2_frmsizeenum,
+                pixel_format=fmt.pixelformat,
+            ):
+                if size.type != V4L2_FRMSIZE_TYPE_DISCRETE:
+                    break
+                rates = sizes.setdefault(f"{size.width}x{size.height}", [])
+                for interval in _enumerate(
+                    fd,
+                    VIDIOC_ENUM_FRAMEINTERVALS,
+                    v4l2_frmivalenum,
+                    pixel_format=fmt.pixelformat,
+                    width=size.width,
+                    height=size.height,
+                ):
+                    if interval.type != V4L2_FRMIVAL_TYPE_DISCRETE:
+                        break
+                    if interval.numerator:
+                        rates.append(interval.denominator / interval.numerator)
+    finally:
+        os.close(fd)
+    return controls, formats
+
+
+# Backends without a control query: a control is supported when the backend
+# returns a value for it, the range is the default one
+def _probe_capture(cap):
+    controls = {}
+    for name, (prop, _) in CONTROLS.items():
+        value = cap.get(prop)
+        if value == -1:
+            continue
+        low, high = DEFAULT_RANGES[name]
+        controls[name] = {"min": low, "max": high, "step": 1, "value": value}
+    fourcc = _fourcc(int(cap.get(cv2.CAP_PROP_FOURCC)))
+    size = (
+        f"{int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))}"
+        f"x{int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))}"
+    )
+    return controls, {fourcc: {size: [cap.get(cv2.CAP_PROP_FPS)]}}
+
+
+class Capabilities:
+    """
+    What a camera supports: the controls (name: min, max, step, default and
+    the last known value), and the frame formats ({fourcc: {"WxH": [fps,
+    ...]}}). Probed once per device identity and kept as JSON in
+    CAPABILITY_DIR, so later opens read the file instead of the device.
+    The values read back while the camera runs update the file when the
+    device is closed.
+    """
+
+    def __init__(self, identity, backend="", controls=None, formats=None):
+        self.identity = identity
+        self.backend = backend
+        self.controls = controls or {}
+        self.formats = formats or {}
+        self.changed = False  # values differ from the file
+
+    # Probe an open VideoCapture; device is the V4L2 node to query the
+    # control ranges and frame formats from (Linux only)
+    @classmethod
+    def probe(cls, cap, identity, device=None):
+        controls = formats = None
+        if device is not None and platform.system() == "Linux":
+            try:
+                controls, formats = _probe_v4l2(device)
+            except OSError as e:
+                print(f"Cannot query {device}: {e}")
+        if not controls and not formats:  # not a V4L2 device after all
+            controls, formats = _probe_capture(cap)
+        return cls(identity, cap.getBackendName(), controls, formats)
+
+    @classmethod
+    def load(cls, identity, directory=CAPABILITY_DIR):
+        path = os.path.join(directory, f"{identity}.json")
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            print(f"Cannot load capabilities {path}: {e}")
+            return None
+        return cls(identity, data["backend"], data["controls"], data["formats"])
+
+    def save(self, directory=CAPABILITY_DIR):
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{self.identity}.json")
+        data = {
+            "backend": self.backend,
+            "controls": self.controls,
+            "formats": self.formats,
+        }
+        temporary = path + ".tmp"
+        with open(temporary, "w") as f:
+            json.dump(data, f, indent=1)
+        os.replace(temporary, path)
+        self.changed = False
+
+    def supports(self, prop):
+        name = PROPERTY_NAMES.get(prop)
+        return name is None or name in self.controls
+
+    # (min, max) of a control, the default range when it was not probed
+    def range(self, name):
+        control = self.controls.get(name)
+        if control is None:
+            return DEFAULT_RANGES[name]
+        return control["min"], control["max"]
+
+    def value(self, name):
+        control = self.controls.get(name)
+        return None if control is None else control["value"]
+
+    # Remember the values read back from the device (for the next dialog)
+    def update_values(self, values):
+        for prop, value in values.items():
+            control = self.controls.get(PROPERTY_NAMES.get(prop))
+            if control is not None and control["value"] != value:
+                control["value"] = value
+                self.changed = True
+
+    def capture_format(self, fourcc="MJPG", size=(3264, 2448)):
+        """
+        (fourcc, (width, height), fps) to open the device with: fourcc if
+        the device has it (else its first format), at size if listed (else
+        the largest), at the highest rate listed for it (None if unknown).
+        None when no formats were probed.
+        """
+        if not self.formats:
+            return None
+        if fourcc not in self.formats:
+            fourcc = next(iter(self.formats))
+        sizes = self.formats[fourcc]
+        if not sizes:
+            return None
+        key = f"{size[0]}x{size[1]}"
+        if key not in sizes:
+            key = max(sizes, key=lambda k: int(k.split("x")[0]) * int(k.split("x")[1]))
+        width, height = (int(v) for v in key.split("x"))
+        rates = sizes[key]
+        return fourcc, (width, height), max(rates) if rates else None
+
+
+# VideoCapture property: control name
+PROPERTY_NAMES = {prop: name for name, (prop, _) in CONTROLS.items()}
+
+
+def device_capabilities(cap, identity, device=None, directory=CAPABILITY_DIR):
+    """
+    Capabilities of the opened device from the cache, probed and cached on
+    the first open of this identity.
+    """
+    capabilities = Capabilities.load(identity, directory)
+    if capabilities is None:
+        capabilities = Capabilities.probe(cap, identity, device)
+        print(
+            f"Probed {identity}: {len(capabilities.controls)} controls, "
+            f"formats {', '.join(capabilities.formats) or 'unknown'}"
+        )
+        try:
+            capabilities.save(directory)
+        except OSError as e:
+            print(f"Cannot save capabilities of {identity}: {e}")
+    return capabilities
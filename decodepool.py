@@ -0,0 +1,117 @@
+# Parallel MJPEG decoding for the camera thread
+import threading, time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from frames import Frame
+from instrumentation import pipeline_stats
+from mjpeg import decode_jpeg
+
+
+class DecodePool:
+    """
+    Decode compressed frames on a pool of worker threads.
+
+    cv2.imdecode releases the GIL, so the workers decode on separate cores
+    while the camera thread keeps grabbing. Frames are delivered in sequence
+    order: a frame that finishes before an older one waits in a small
+    reorder buffer until the older one is decoded (or failed). One worker at
+    a time delivers, outside the pool lock, so a slow deliver() never holds
+    up submit() or the other workers' decoding. When every worker is busy
+    and the backlog is full, the oldest frame still waiting for a worker is
+    cancelled, so the pool never falls further behind the camera than one
+    frame per worker.
+    """
+
+    def __init__(self, workers, deliver):
+        self.workers = workers
+        self.deliver = deliver  # called with each decoded Frame, in order
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix="decode")
+        self._lock = threading.Lock()
+        self._waiting = deque()  # (seq, future) not yet picked by a worker
+        self._pending = set()  # seqs submitted and not decoded or cancelled
+        self._ready = {}  # seq: decoded Frame waiting for older frames
+        self._delivering = False  # a worker is running deliver()
+
+        # Counters (read them with stats())
+        self.submitted = 0
+        self.delivered = 0
+        self.dropped_backlog = 0  # cancelled before a worker picked it up
+        self.failed = 0  # corrupt JPEG data
+
+    def submit(self, data, seq, timestamp, reduction=1, grayscale=False):
+        with self._lock:
+            self.submitted += 1
+            # forget the frames the workers have already started on
+            while self._waiting and not self._is_waiting(self._waiting[0][1]):
+                self._waiting.popleft()
+            while len(self._waiting) >= self.workers:
+                old_seq, future = self._waiting.popleft()
+                if future.cancel():
+                    self._pending.discard(old_seq)
+                    self.dropped_backlog += 1
+            future = self._executor.submit(
+                self._decode, data, seq, timestamp, reduction, grayscale
+            )
+            self._waiting.append((seq, future))
+            self._pending.add(seq)
+
+    # The executor hands out work in FIFO order, so started futures are
+    # always at the head of the waiting queue
+    @staticmethod
+    def _is_waiting(future):
+        return not (future.running() or future.done())
+
+    def _decode(self, data, seq, timestamp, reduction, grayscale):
+        start = time.perf_counter()
+        image = decode_jpeg(data, reduction, grayscale)
+        if pipeline_stats.enabled and image is not None:
+            pipeline_stats.add("decode", start)
+        frame = None
+        if image is not None:
+            frame = Frame(image, seq, timestamp, scale=1.0 / reduction)
+        with self._lock:
+            self._pending.discard(seq)
+            if frame is None:
+                self.failed += 1
+            else:
+                self._ready[seq] = frame
+            if self._delivering:
+                return  # the delivering worker picks this frame up
+            self._delivering = True
+        try:
+            while True:
+                with self._lock:
+                    frames = self._take_ready()
+                    if not frames:
+                        self._delivering = False
+                        return
+                for frame in frames:
+                    self.deliver(frame)
+        except BaseException:
+            with self._lock:
+                self._delivering = False
+            raise
+
+    # The buffered frames no older frame is still being decoded for, in
+    # sequence order. Called with the lock held.
+    def _take_ready(self):
+        oldest = min(self._pending, default=None)
+        ready = sorted(s for s in self._ready if oldest is None or s < oldest)
+        self.delivered += len(ready)
+        return [self._ready.pop(s) for s in ready]
+
+    def close(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "submitted": self.submitted,
+                "delivered": self.delivered,
+                "reordering": len(self._ready),
+                "dropped_backlog": self.dropped_backlog,
+                "failed": self.failed,
+                "in_flight": sum(not f.done() for _, f in self._waiting),
+            }
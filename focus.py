@@ -0,0 +1,111 @@
+# Focus aid: sharpness of an ROI around the focus point, and an automatic
+# focus sweep that picks the sharpest lens position
+import cv2
+import numpy as np
+
+from frames import to_gray
+
+
+def sharpness(image, scale, centre, size=256):
+    """
+    Variance of the Laplacian in a size x size ROI around centre (both in
+    sensor pixels) of a BGR or grayscale frame; higher is sharper. Only the
+    ROI is touched, so the cost does not depend on the frame size. Values
+    are comparable between frames of the same decode resolution. Returns
+    None when the ROI is outside the frame.
+    """
+    half = max(8, round(size * scale / 2))
+    cx = round((centre[0] + 0.5) * scale - 0.5)
+    cy = round((centre[1] + 0.5) * scale - 0.5)
+    h, w = image.shape[:2]
+    x0, y0 = max(0, cx - half), max(0, cy - half)
+    x1, y1 = min(w, cx + half), min(h, cy + half)
+    if x1 - x0 < 8 or y1 - y0 < 8:
+        return None
+    laplacian = cv2.Laplacian(to_gray(image[y0:y1, x0:x1]), cv2.CV_16S, ksize=3)
+    _, std = cv2.meanStdDev(laplacian)
+    return float(std[0, 0]) ** 2
+
+
+class FocusSweep:
+    """
+    Steps the focus through low..high and picks the sharpest position: a
+    coarse pass, then a fine pass around the best coarse step, then a
+    parabola through the best fine step and its neighbours.
+
+    The camera thread drives it: moved(seq) after setting position(), then
+    add(seq, sharpness) for every frame. Frames up to `settle` after the
+    move are skipped (lens travel, frames already in flight) and the next
+    `samples` are averaged. add() returns True when the focus has to move
+    to position(), or, once done, to best.
+    """
+
+    def __init__(self, low=0, high=1023, coarse=None, fine=None, settle=3, samples=2):
+        # by default 32 coarse steps over the range, fine steps of 1/8 of one
+        if coarse is None:
+            coarse = max(1, round((high - low) / 32))
+        if fine is None:
+            fine = max(1, coarse // 8)
+        self.low = low
+        self.high = high
+        self.fine = fine
+        self.settle = settle
+        self.samples = samples
+        self.positions = list(range(low, high + 1, coarse))
+        self.coarse = coarse
+        self.index = 0
+        self.scores = {}  # position: mean sharpness
+        self.moved_at = None  # sequence number of the last frame before the move
+        self.values = []
+        self.fine_pass = False
+        self.done = False
+        self.best = None
+
+    def position(self):
+        return self.positions[self.index]
+
+    def moved(self, seq):
+        self.moved_at = seq
+        self.values = []
+
+    def add(self, seq, value):
+        if self.done or self.moved_at is None or value is None:
+            return False
+        if seq <= self.moved_at + self.settle:
+            return False
+        self.values.append(value)
+        if len(self.values) < self.samples:
+            return False
+        self.scores[self.position()] = sum(self.values) / len(self.values)
+        self.moved_at = None  # until the next move
+        self.index += 1
+        if self.index == len(self.positions):
+            if self.fine_pass:
+                self.best = self.peak()
+                self.done = True
+                return True
+            # fine pass around the best coarse position
+            centre = max(self.scores, key=self.scores.get)
+            low = max(self.low, centre - self.coarse)
+            high = min(self.high, centre + self.coarse)
+            self.positions = [
+                p for p in range(low, high + 1, self.fine) if p not in self.scores
+            ]
+            self.index = 0
+            self.fine_pass = True
+            if not self.positions:
+                self.best = self.peak()
+                self.done = True
+        return True
+
+    # Sharpest position, refined with a parabola through its neighbours
+    def peak(self):
+        positions = sorted(self.scores)
+        values = np.array([self.scores[p] for p in positions])
+        i = int(values.argmax())
+        if 0 < i < len(positions) - 1:
+            x = np.array(positions[i - 1 : i + 2], float)
+            a, b, _ = np.polyfit(x, values[i - 1 : i + 2], 2)
+            if a < 0:
+                return int(round(np.clip(-b / (2 * a), x[0], x[2])))
+        return positions[i]
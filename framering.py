@@ -0,0 +1,145 @@
+# Capture and decode in a separate process, frames passed through shared memory
+#
+# The capture process owns the frame source, decodes each frame and copies it into
+# a free slot of a shared memory ring of preallocated frame buffers. Only the
+# slot index and the frame metadata cross the pipe. The GUI process maps the
+# slot without copying and sends the index back when the frame is released.
+#
+# This module must not import Qt: it is the entry point of the spawned
+# capture process.
+import time
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+from framesource import PropertyQueue
+from mjpeg import decode_jpeg, is_encoded
+
+# One full resolution BGR frame
+SLOT_BYTES = 3264 * 2448 * 3
+
+
+class FrameRing:
+    """
+    Shared memory block of `slots` frame buffers of `slot_bytes` each.
+    Create it with name=None, attach to an existing one by name.
+    """
+
+    def __init__(self, slots, slot_bytes=SLOT_BYTES, name=None):
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=slots * slot_bytes)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+
+    # ndarray of the given shape mapped onto a slot, no copy
+    def view(self, slot, shape):
+        return np.ndarray(
+            shape, np.uint8, buffer=self.shm.buf, offset=slot * self.slot_bytes
+        )
+
+    def close(self):
+        try:
+            self.shm.close()
+        except BufferError:
+            # a frame view is still alive; the mapping goes away with it
+            print("Frame ring still in use, leaving it mapped")
+
+    def unlink(self):
+        self.shm.unlink()
+
+
+def capture_main(source, ring_name, slots, slot_bytes, reduced_decode, frames, control):
+    """
+    Entry point of the capture process, reading the (unopened) FrameSource.
+
+    Sends ("opened", ok), ("capabilities", Capabilities) for a device, then
+    ("frame", slot, seq, timestamp, shape, scale, read_start, decoded) for
+    every frame written into the ring, and ("stopped", dropped) at the end.
+    read_start and decoded (None when the source delivered a decoded frame)
+    time the read and decode stages.
+    Accepts ("free", slot), ("reduction", n), ("grayscale", enabled),
+    ("property", prop, value), ("read", props) and ("stop",) on control.
+    Property writes are coalesced and applied between frames, each batch
+    answered with ("properties", writes, values read back).
+    Timestamps are time.perf_counter(), which is system wide on Linux and
+    Windows, so the GUI process can compare them with its own clock.
+    """
+    ring = FrameRing(slots, slot_bytes, name=ring_name)
+    opened = source.open(encoded=reduced_decode)
+    free = list(range(slots))
+    reduction = 1
+    grayscale = False
+    shape = None  # of the decoded frames, once known
+    seq = 0
+    dropped = 0  # no free slot, the GUI still holds all of them
+    properties = PropertyQueue()
+
+    running = opened
+    frames.send(("opened", running))
+    if source.capabilities is not None:
+        frames.send(("capabilities", source.capabilities))
+    while running:
+        while control.poll():
+            message = control.recv()
+            if message[0] == "free":
+                free.append(message[1])
+            elif message[0] == "reduction":
+                reduction = message[1]
+            elif message[0] == "grayscale":
+                grayscale = message[1]
+            elif message[0] == "property":
+                properties.set(message[1], message[2])
+            elif message[0] == "read":
+                properties.read(message[1])
+            elif message[0] == "stop":
+                running = False
+        if not running:
+            break
+        if properties.pending():
+            writes, reads = properties.take()
+            frames.send(("properties", writes, source.apply_properties(writes, reads)))
+
+        # Decoded frames are read straight into a free slot, no copy
+        target = None
+        if shape is not None and free and not grayscale:
+            target = ring.view(free[-1], shape)
+        read_start = time.perf_counter()
+        ret, image = source.read(target)
+        if not ret:
+            continue
+        timestamp = time.perf_counter()
+        seq += 1
+        if not free:
+            dropped += 1
+            continue
+
+        scale = 1.0
+        decoded = None
+        if is_encoded(image):
+            image = decode_jpeg(image, reduction, grayscale)
+            if image is None:
+                continue  # corrupt JPEG from the device, skip it
+            decoded = time.perf_counter()
+            scale = 1.0 / reduction
+        elif grayscale and image.ndim == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        if image.nbytes > slot_bytes:
+            print(f"Frame {image.shape} does not fit a ring slot, dropped")
+            continue
+
+        slot = free.pop()
+        if image is not target:
+            np.copyto(ring.view(slot, image.shape), image)
+        if decoded is None and not grayscale:
+            shape = image.shape
+        frames.send(
+            ("frame", slot, seq, timestamp, image.shape, scale, read_start, decoded)
+        )
+
+    source.close()
+    ring.close()
+    frames.send(("stopped", dropped))
@@ -0,0 +1,165 @@
+# Frame handoff between the camera thread and the GUI thread
+import threading, time
+import cv2
+import numpy as np
+
+
+# Luminance of a BGR frame; grayscale frames are returned as they are
+def to_gray(image):
+    if image.ndim == 3:
+        return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return image
+
+
+class Frame:
+    """
+    A captured image together with its sequence number and capture time.
+    scale is the image size relative to the sensor (0.5 for a frame decoded
+    at half resolution). on_release is called once, when the image memory
+    can be reused (e.g. to return a shared memory slot): a new frame has one
+    owner, every retain() adds one and every release() drops one.
+    """
+
+    _refs_lock = threading.Lock()
+
+    def __init__(self, image, seq=0, timestamp=None, scale=1.0, on_release=None):
+        self.image = image
+        self.seq = seq
+        self.scale = scale
+        # perf_counter() when the frame left the device
+        self.timestamp = time.perf_counter() if timestamp is None else timestamp
+        self.on_release = on_release
+        self._refs = 1
+        # perf_counter() when the frame was posted, set only while the
+        # pipeline instrumentation is enabled
+        self.posted = None
+        # Focus metric of the frame (focus.sharpness), set while measured
+        self.sharpness = None
+
+    # Take an extra reference for another consumer, returns the frame
+    def retain(self):
+        with self._refs_lock:
+            self._refs += 1
+        return self
+
+    def release(self):
+        with self._refs_lock:
+            if self._refs <= 0:
+                return
+            self._refs -= 1
+            if self._refs:
+                return
+            on_release, self.on_release = self.on_release, None
+        if on_release is not None:
+            on_release()
+
+
+class BufferPool:
+    """
+    A fixed number of reusable frame buffers for the capture thread.
+
+    acquire(shape) returns (image, release): a uint8 array of that shape on a
+    free buffer and the callable that gives the buffer back, to be passed as
+    Frame(on_release=release). Buffers are allocated on first use, up to
+    count, and then recycled, so steady-state streaming does no large
+    allocations. When all of them are held, acquire returns (None, None)
+    and the caller reads into a fresh array instead.
+    """
+
+    def __init__(self, count):
+        self.count = count
+        self._lock = threading.Lock()
+        self._free = []  # flat uint8 buffers
+        self._allocated = 0
+
+        # Counters (read them with stats())
+        self.allocations = 0
+        self.reuses = 0
+        self.misses = 0  # every buffer was in use
+
+    def acquire(self, shape):
+        nbytes = int(np.prod(shape))
+        buffer = None
+        with self._lock:
+            while self._free:
+                candidate = self._free.pop()
+                if candidate.nbytes >= nbytes:
+                    buffer = candidate
+                    self.reuses += 1
+                    break
+                self._allocated -= 1  # too small for the new frame size
+            if buffer is None:
+                if self._allocated >= self.count:
+                    self.misses += 1
+                    return None, None
+                self._allocated += 1
+                self.allocations += 1
+        if buffer is None:
+            buffer = np.empty(nbytes, np.uint8)
+        return buffer[:nbytes].reshape(shape), lambda: self._release(buffer)
+
+    def _release(self, buffer):
+        with self._lock:
+            self._free.append(buffer)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "buffers": self._allocated,
+                "allocations": self.allocations,
+                "reuses": self.reuses,
+                "misses": self.misses,
+            }
+
+
+class FrameMailbox:
+    """
+    Single-slot, "latest frame wins" handoff.
+
+    The producer overwrites the slot on every post, the consumer takes the
+    newest frame when it is ready to paint. post() returns True only when the
+    slot was empty, so the producer signals once per pending frame and the
+    GUI event queue never holds more than one notification. A superseded
+    frame is released; a taken frame belongs to the consumer.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._frame = None
+
+        # Counters (read them with stats())
+        self.posted = 0
+        self.taken = 0
+        self.superseded = 0  # overwritten before the consumer took them
+
+    def post(self, frame):
+        with self._lock:
+            old, self._frame = self._frame, frame
+            if old is not None:
+                self.superseded += 1
+            self.posted += 1
+        if old is not None:
+            old.release()
+        return old is None
+
+    def take(self):
+        with self._lock:
+            frame, self._frame = self._frame, None
+            if frame is not None:
+                self.taken += 1
+        return frame
+
+    def clear(self):
+        with self._lock:
+            frame, self._frame = self._frame, None
+        if frame is not None:
+            frame.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "posted": self.posted,
+                "taken": self.taken,
+                "superseded": self.superseded,
+                "pending": int(self._frame is not None),
+            }
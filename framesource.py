@@ -0,0 +1,353 @@
+# Frame sources read by the camera threads: live camera, file replay, synthetic
+import glob, os, threading, time
+import cv2
+import numpy as np
+
+from camera import camera_device, device_identity, forget_camera, open_camera
+from capabilities import Capabilities, device_capabilities
+
+SENSOR_WIDTH = 3264
+SENSOR_HEIGHT = 2448
+
+
+class FrameSource:
+    """
+    Base class of the frame sources.
+
+    A source is only configured in __init__ and touches files or devices in
+    open(), so an unopened source can be pickled into the capture process.
+    read() works like VideoCapture.read() and returns (ok, frame). When the
+    source was opened with encoded=True and can do it, frame is a compressed
+    JPEG buffer (see mjpeg.is_encoded), otherwise a decoded BGR image. Like
+    VideoCapture.read(image), sources that can write a decoded frame into
+    image do so when the shape matches; callers check `frame is image`.
+    """
+
+    name = "source"
+    # VideoCapture of a real device, for property access (None otherwise)
+    cap = None
+    # Capabilities of that device, from the cache once it is open
+    capabilities = None
+
+    def open(self, encoded=False):
+        return True
+
+    def read(self, image=None):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    # Write the {prop: value} VideoCapture properties in order, then read
+    # back the written and the requested ones. Properties the device does
+    # not support are skipped. Returns {prop: value} as reported by the
+    # device, empty for sources without a device.
+    def apply_properties(self, writes, reads=()):
+        if self.cap is None:
+            return {}
+        capabilities = self.capabilities
+        props = [*writes, *reads]
+        if capabilities is not None:
+            props = [prop for prop in props if capabilities.supports(prop)]
+        for prop in props:
+            if prop in writes:
+                self.cap.set(prop, float(writes[prop]))
+        values = {prop: self.cap.get(prop) for prop in props}
+        if capabilities is not None:
+            capabilities.update_values(values)
+        return values
+
+    def __str__(self):
+        return self.name
+
+
+class PropertyQueue:
+    """
+    Camera property writes and reads posted from the GUI for the thread that
+    owns the device, which applies them between frames. Only the newest
+    value of each property is kept, so dragging a slider costs at most one
+    device write per frame instead of one per slider step.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.writes = {}  # prop: newest value, in the order of the changes
+        self.reads = set()
+
+    def set(self, prop, value):
+        with self.lock:
+            self.writes.pop(prop, None)
+            self.writes[prop] = value
+
+    def read(self, props):
+        with self.lock:
+            self.reads.update(props)
+
+    def pending(self):
+        return bool(self.writes or self.reads)
+
+    # The queued (writes, reads), leaving the queue empty
+    def take(self):
+        with self.lock:
+            writes, reads = self.writes, self.reads
+            self.writes, self.reads = {}, set()
+        return writes, reads - writes.keys()
+
+
+class Pacer:
+    """
+    Sleep between reads to hold a frame rate. fps <= 0 means no pacing.
+    """
+
+    def __init__(self, fps):
+        self.interval = 1.0 / fps if fps and fps > 0 else 0.0
+        self.next_time = None
+
+    def wait(self):
+        if not self.interval:
+            return
+        now = time.perf_counter()
+        if self.next_time is None or now - self.next_time > self.interval:
+            self.next_time = now  # first frame, or we fell behind: resync
+        elif self.next_time > now:
+            time.sleep(self.next_time - now)
+        self.next_time += self.interval
+
+
+class CameraSource(FrameSource):
+    """
+    The live camera, opened with the platform backend (camera.open_camera).
+    """
+
+    def __init__(self, camera_index):
+        self.camera_index = camera_index
+        self.name = f"camera {camera_index}"
+
+    def open(self, encoded=False):
+        # Capture format from the cached capabilities, the open_camera
+        # defaults until the device has been probed
+        identity = device_identity(self.camera_index)
+        cached = Capabilities.load(identity)
+        capture_format = cached.capture_format() if cached else None
+        if capture_format:
+            self.cap = open_camera(self.camera_index, encoded, *capture_format)
+        else:
+            self.cap = open_camera(self.camera_index, encoded)
+        if not self.cap.isOpened():
+            forget_camera()  # find it again next time, it may have moved
+            return False
+        if cached is not None:
+            self.capabilities = cached
+        else:
+            self.capabilities = device_capabilities(
+                self.cap, identity, camera_device(self.camera_index)
+            )
+        return True
+
+    def read(self, image=None):
+        return self.cap.read(image)
+
+    def close(self):
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+        # keep the last values for the next dialog
+        if self.capabilities is not None and self.capabilities.changed:
+            try:
+                self.capabilities.save()
+            except OSError as e:
+                print(f"Cannot save capabilities of {self.capabilities.identity}: {e}")
+
+
+class ReplaySource(FrameSource):
+    """
+    Replay of a recorded video file (MJPEG/AVI/...) or of an image sequence.
+
+    path is a video file, a directory of images or a glob pattern. With
+    realtime=True frames are paced at the original rate (the video frame
+    rate, or fps for image sequences), otherwise as fast as they can be
+    read. JPEG image sequences can be delivered undecoded.
+    """
+
+    IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff")
+
+    def __init__(self, path, realtime=True, loop=True, fps=15.0):
+        self.path = path
+        self.realtime = realtime
+        self.loop = loop
+        self.fps = fps
+        self.name = f"replay {path}"
+        self.files = None
+        self.video = None
+        self.index = 0
+        self.encoded = False
+        self.pacer = None
+
+    def open(self, encoded=False):
+        self.encoded = encoded
+        self.index = 0
+        if os.path.isdir(self.path):
+            pattern = os.path.join(self.path, "*")
+        elif any(c in self.path for c in "*?["):
+            pattern = self.path
+        else:
+            pattern = None
+
+        fps = self.fps
+        if pattern is not None:
+            self.files = sorted(
+                f
+                for f in glob.glob(pattern)
+                if f.lower().endswith(self.IMAGE_EXTENSIONS)
+            )
+            opened = bool(self.files)
+        else:
+            self.video = cv2.VideoCapture(self.path)
+            opened = self.video.isOpened()
+            fps = self.video.get(cv2.CAP_PROP_FPS) or self.fps
+        self.pacer = Pacer(fps if self.realtime else 0)
+        return opened
+
+    def read(self, image=None):
+        if self.files is not None:
+            if self.index >= len(self.files):
+                if not self.loop:
+                    return False, None
+                self.index = 0
+            path = self.files[self.index]
+            self.index += 1
+            if self.encoded and path.lower().endswith((".jpg", ".jpeg")):
+                frame = np.fromfile(path, np.uint8).reshape(1, -1)
+            else:
+                frame = cv2.imread(path, cv2.IMREAD_COLOR)
+            self.pacer.wait()
+            return frame is not None, frame
+
+        ret, frame = self.video.read(image)
+        if not ret and self.loop:
+            self.video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.video.read(image)
+        self.pacer.wait()
+        return ret, frame
+
+    def close(self):
+        if self.video is not None:
+            self.video.release()
+            self.video = None
+
+
+def make_collimation_image(
+    width=SENSOR_WIDTH, height=SENSOR_HEIGHT, center=None, decentre=(0.0, 0.0)
+):
+    """
+    Draw a collimation-like view: the lit primary mirror, the dark secondary
+    silhouette with its spider vanes, the reflected rings and the primary
+    centre marker. decentre (x, y) in pixels moves the secondary and its
+    reflections away from center, as a miscollimated telescope would.
+    """
+    if center is None:
+        center = (width / 2, height / 2)
+    s = height / SENSOR_HEIGHT  # drawing scale
+    shift = 4  # sub-pixel precision of the cv2 drawing calls
+
+    def point(x, y):
+        return (int(round(x * (1 << shift))), int(round(y * (1 << shift))))
+
+    def radius(r):
+        return int(round(r * s * (1 << shift)))
+
+    image = np.full((height, width, 3), 18, np.uint8)
+    cx, cy = center
+    sx, sy = cx + decentre[0], cy + decentre[1]
+    aa = cv2.LINE_AA
+
+    # primary mirror and the collimator's reflected outer ring
+    cv2.circle(image, point(cx, cy), radius(1100), (150, 150, 150), -1, aa, shift)
+    cv2.circle(
+        image, point(sx, sy), radius(700), (205, 205, 205), int(10 * s) + 1, aa, shift
+    )
+
+    # spider vanes, then the secondary silhouette on top
+    for angle in (0, 90, 180, 270):
+        a = np.radians(angle)
+        end = point(sx + 1100 * s * np.cos(a), sy + 1100 * s * np.sin(a))
+        cv2.line(image, point(sx, sy), end, (25, 25, 25), int(8 * s) + 1, aa, shift)
+    cv2.circle(image, point(sx, sy), radius(380), (30, 30, 30), -1, aa, shift)
+
+    # reflection of the primary inside the secondary and the centre marker
+    cv2.circle(
+        image, point(sx, sy), radius(300), (120, 120, 120), int(6 * s) + 1, aa, shift
+    )
+    mx, my = cx + decentre[0] / 2, cy + decentre[1] / 2
+    cv2.circle(
+        image, point(mx, my), radius(60), (235, 235, 235), int(12 * s) + 1, aa, shift
+    )
+    return image
+
+
+class SyntheticSource(FrameSource):
+    """
+    Generated collimation images (make_collimation_image) at any resolution
+    and frame rate, with Gaussian sensor noise.
+
+    A few noisy variants are rendered (and JPEG encoded, for the encoded
+    mode) in open() and then cycled, so reading costs almost nothing and
+    throughput measurements see the pipeline, not the generator. fps <= 0
+    delivers frames as fast as they are read.
+    """
+
+    def __init__(
+        self,
+        width=SENSOR_WIDTH,
+        height=SENSOR_HEIGHT,
+        fps=15.0,
+        center=None,
+        decentre=(0.0, 0.0),
+        noise=6.0,
+        variants=4,
+        jpeg_quality=90,
+    ):
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.center = center
+        self.decentre = decentre
+        self.noise = noise
+        self.variants = variants
+        self.jpeg_quality = jpeg_quality
+        self.name = f"synthetic {width}x{height}@{fps}"
+        self.frames = []
+        self.index = 0
+        self.pacer = None
+
+    def open(self, encoded=False):
+        base = make_collimation_image(
+            self.width, self.height, self.center, self.decentre
+        )
+        # one noise field, rolled by a different amount for each variant
+        rng = np.random.default_rng(0)
+        noise = rng.standard_normal(base.shape, dtype=np.float32) * self.noise
+        noise = noise.astype(np.int16)
+        self.frames = []
+        for i in range(max(1, self.variants)):
+            frame = base
+            if self.noise > 0:
+                shifted = np.roll(noise, i * 7919)
+                frame = np.clip(base + shifted, 0, 255).astype(np.uint8)
+            if encoded:
+                params = [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality]
+                frame = cv2.imencode(".jpg", frame, params)[1].reshape(1, -1)
+            self.frames.append(frame)
+        self.index = 0
+        self.pacer = Pacer(self.fps)
+        return True
+
+    def read(self, image=None):
+        self.pacer.wait()
+        frame = self.frames[self.index % len(self.frames)]
+        self.index += 1
+        # hand out a copy, like a device read does
+        if image is not None and image.shape == frame.shape:
+            np.copyto(image, frame)
+            return True, image
+        return True, frame.copy()
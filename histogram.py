@@ -0,0 +1,80 @@
+# Luminance histogram and exposure clipping of the live frames
+import threading, time
+import numpy as np
+from PyQt6.QtCore import QThread, pyqtSignal
+
+from frames import FrameMailbox, to_gray
+
+# Levels counted as clipped highlights and as crushed shadows
+CLIP_LEVEL = 253
+CRUSH_LEVEL = 2
+
+
+def luminance_histogram(image, step=8):
+    """
+    256-bin luminance histogram of every step'th pixel in both directions
+    of a BGR or grayscale frame. Returns a dict with "counts" and the
+    "clipped" (>= CLIP_LEVEL) and "crushed" (<= CRUSH_LEVEL) fractions.
+    """
+    sample = np.ascontiguousarray(image[::step, ::step])
+    counts = np.bincount(to_gray(sample).ravel(), minlength=256)
+    total = max(1, int(counts.sum()))
+    return {
+        "counts": counts,
+        "clipped": float(counts[CLIP_LEVEL:].sum()) / total,
+        "crushed": float(counts[: CRUSH_LEVEL + 1].sum()) / total,
+    }
+
+
+class HistogramThread(QThread):
+    """
+    Computes the luminance histogram of the newest frame rate times per
+    second and emits it with resultReady. Frames that arrive before the
+    next histogram is due are not retained, so the worker never holds a
+    capture buffer while it waits. The subsample step is scaled with the
+    frame, about every 8th sensor pixel whatever the decode resolution.
+    """
+
+    resultReady = pyqtSignal(object)
+
+    def __init__(self, rate=4.0, step=8):
+        super().__init__()
+        self.rate = rate
+        self.step = step
+        self.mailbox = FrameMailbox()
+        self._wake = threading.Event()
+        self.next_time = 0.0
+        self.running = False
+
+    # Called from the GUI thread with each new frame
+    def submit(self, frame):
+        now = time.perf_counter()
+        if now < self.next_time:
+            return
+        self.next_time = now + 1.0 / self.rate
+        self.mailbox.post(frame.retain())
+        self._wake.set()
+
+    def run(self):
+        self.running = True
+        while self.running:
+            if not self._wake.wait(0.1):
+                continue
+            self._wake.clear()
+            frame = self.mailbox.take()
+            if frame is None:
+                continue
+            try:
+                start = time.perf_counter()
+                step = max(1, round(self.step * frame.scale))
+                result = luminance_histogram(frame.image, step)
+            finally:
+                frame.release()
+            result["duration"] = time.perf_counter() - start
+            self.resultReady.emit(result)
+        self.mailbox.clear()
+
+    def stop(self):
+        self.running = False
+        self._wake.set()
+        self.wait()
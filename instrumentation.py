@@ -0,0 +1,93 @@
+# Per-stage pipeline timings for the diagnostics HUD and CSV export
+import csv, threading, time
+import numpy as np
+
+# Pipeline stages, in frame order
+STAGES = (
+    "read",  # source/device read
+    "decode",  # JPEG decode
+    "calibrate",  # dark/flat calibration
+    "average",  # temporal averaging
+    "handoff",  # mailbox post to GUI take
+    "convert",  # BGR buffer to QPixmap
+    "scale",  # viewport crop and resize
+    "overlay",  # overlay draw/composite
+    "paint",  # whole paintEvent
+    "analysis",  # collimation analysis, off the display path
+)
+
+
+class PipelineStats:
+    """
+    Rolling per-stage timings kept in preallocated ring buffers.
+
+    Recording is off by default. Call sites check `enabled` before taking
+    any timestamp, so a disabled instance costs one attribute lookup per
+    stage and can stay in production builds.
+    """
+
+    def __init__(self, size=300):
+        self.enabled = False
+        self.size = size
+        self._lock = threading.Lock()
+        # per stage: end time and duration of the last `size` samples
+        self._at = {stage: np.zeros(size) for stage in STAGES}
+        self._ms = {stage: np.zeros(size) for stage in STAGES}
+        self._count = dict.fromkeys(STAGES, 0)
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+
+    def clear(self):
+        with self._lock:
+            self._count = dict.fromkeys(STAGES, 0)
+
+    def add(self, stage, start, end=None):
+        """Record one sample of stage that ran from start (perf_counter)."""
+        if end is None:
+            end = time.perf_counter()
+        with self._lock:
+            i = self._count[stage] % self.size
+            self._at[stage][i] = end
+            self._ms[stage][i] = (end - start) * 1000.0
+            self._count[stage] += 1
+
+    def _samples(self, stage):
+        n = min(self._count[stage], self.size)
+        return self._at[stage][:n], self._ms[stage][:n]
+
+    def mean_ms(self, stage):
+        with self._lock:
+            _, ms = self._samples(stage)
+            return float(ms.mean()) if len(ms) else None
+
+    def rate(self, stage):
+        """Samples per second of stage over the ring window."""
+        with self._lock:
+            at, _ = self._samples(stage)
+            if len(at) < 2:
+                return None
+            span = at.max() - at.min()
+            return (len(at) - 1) / span if span > 0 else None
+
+    def summary(self):
+        return {stage: self.mean_ms(stage) for stage in STAGES}
+
+    def write_csv(self, path):
+        """Write every sample in the rings as stage, time (s), duration (ms)."""
+        with self._lock:
+            rows = []
+            for stage in STAGES:
+                at, ms = self._samples(stage)
+                rows.extend((stage, a, m) for a, m in zip(at, ms))
+        rows.sort(key=lambda row: row[1])
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(("stage", "time_s", "duration_ms"))
+            for stage, at, ms in rows:
+                writer.writerow((stage, f"{at:.6f}", f"{ms:.3f}"))
+        return len(rows)
+
+
+# Shared by the camera threads, the decode workers and the video window
+pipeline_stats = PipelineStats()
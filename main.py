@@ -35,14 +35,27 @@ operational context.
 ────────────────────────────────────────────────────────────────────────
 '''
 
-import sys, os
-from PyQt6.QtWidgets import QApplication
+import sys, os, argparse
+from PyQt6.QtWidgets import QApplication, QStyle
 from PyQt6 import uic
 from mainwindow import MainWindow
+from framesource import ReplaySource, SyntheticSource
 from PyQt6.QtGui import QIcon
 
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
+    # Optional frame sources to run without the camera (profiling, testing)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--replay", metavar="PATH",
+                        help="replay a video file, image directory or glob pattern")
+    parser.add_argument("--synthetic", action="store_true",
+                        help="use generated collimation images")
+    parser.add_argument("--fps", type=float, default=15.0,
+                        help="frame rate of the synthetic source or image sequence")
+    parser.add_argument("--capture-process", action="store_true",
+                        help="capture and decode in a separate process (shared memory frames)")
+    args, qt_args = parser.parse_known_args()
+
+    app = QApplication(sys.argv[:1] + qt_args)
 
     # Normalize the path to the UI and asset files 
     ui_file_path = os.path.join(os.path.dirname(__file__), 'ui', 'mainwindow.ui')
@@ -55,10 +68,23 @@ if __name__ == "__main__":
     size = QApplication.primaryScreen().size()
     
     window = MainWindow(ui)
+    if args.replay:
+        window.frame_source = ReplaySource(args.replay, fps=args.fps)
+    elif args.synthetic:
+        window.frame_source = SyntheticSource(fps=args.fps)
+    window.capture_process = args.capture_process
 
     # Set the main window to the UI position and size
     # NOTE: The position is not allowed in wayland protocol!
-    ui.window().setGeometry(size.width() - 363, 0, 363, 750)
+    # The controls scroll when the screen is shorter than their full height
+    available = QApplication.primaryScreen().availableGeometry()
+    title_bar = ui.style().pixelMetric(QStyle.PixelMetric.PM_TitleBarHeight)
+    height = min(ui.scrollAreaWidgetContents.minimumHeight(),
+                 available.height() - title_bar)
+    width = ui.scrollAreaWidgetContents.minimumWidth()
+    if height < ui.scrollAreaWidgetContents.minimumHeight():
+        width += ui.scrollArea.verticalScrollBar().sizeHint().width()
+    ui.window().setGeometry(size.width() - width, 0, width, height)
     ui.show()
     ui.window().setWindowTitle("Python Newtonian Telescope Collimator")
     ui.window().setWindowIcon(icon)
@@ -1,64 +1,493 @@
-from PyQt6.QtWidgets import QMainWindow, QApplication, QColorDialog, QLabel, QMessageBox
+from PyQt6.QtWidgets import (
+    QMainWindow,
+    QApplication,
+    QColorDialog,
+    QFileDialog,
+    QLabel,
+    QMessageBox,
+)
 from PyQt6.QtCore import QThread, pyqtSignal
 from PyQt6.QtGui import QPixmap
-import cv2, os, platform
+import cv2, os, platform, threading, time
+import multiprocessing
+import numpy as np
 from videowindow import VideoWindow
-from camera import find_camera_index_by_name_substring
+from frames import BufferPool, Frame, FrameMailbox
+from mjpeg import choose_reduction, decode_jpeg, is_encoded
+from decodepool import DecodePool
+from framering import FrameRing, SLOT_BYTES, capture_main
+from camera import find_camera, find_camera_index_by_name_substring
+from framesource import CameraSource, PropertyQueue
+from instrumentation import pipeline_stats
 from cameracontrol import CameraControlsDialog
+from analysis import AnalysisThread
+from averaging import MODES as AVERAGE_MODES, FrameAverager
+from calibration import Calibration, MasterCapture
+from histogram import HistogramThread
+from focus import sharpness
 
 
 class CameraThread(QThread):
-    frameCaptured = pyqtSignal(object)
+    # Emitted once when the mailbox goes from empty to holding a frame.
+    # The receiver takes the newest frame from self.mailbox.
+    frameAvailable = pyqtSignal()
+    # Emitted with the MasterCapture once a master dark or flat is complete
+    masterCaptured = pyqtSignal(object)
+    # Emitted with the FocusSweep once it has moved the focus to the peak
+    focusSweepDone = pyqtSignal(object)
+    # Emitted with ({prop: value written}, {prop: value read back}) after
+    # each batch of camera property changes and reads
+    propertiesRead = pyqtSignal(dict, dict)
 
-    def __init__(self, camera_index=None):
+    def __init__(self, source, reduced_decode=False, decode_workers=0):
         super().__init__()
-        self.camera_index = camera_index
-        print(f"Init thread camera with index {self.camera_index}")
+        # FrameSource to read: live camera, replay or synthetic
+        self.source = source
+        print(f"Init thread camera with source {self.source}")
         self.running = False
         self.cap = None
+        # Capabilities of the device (capabilities.py), None until it is open
+        # or for sources without a device
+        self.capabilities = None
+        self.mailbox = FrameMailbox()
+        # Frames read from the source so far (sequence number of the last)
+        self.frames_read = 0
 
-    def run(self):
-        # select the appropriate backend based on the platform
-        platform_name = platform.system().lower()
-        print(f"Running on platform: {platform_name}")
-        if platform_name == "windows":
-            self.cap = cv2.VideoCapture(self.camera_index, cv2.CAP_DSHOW)
-            self.cap.set(cv2.CAP_PROP_AUTO_EXPOSURE, 0.25)  # Set manual exposure
-            self.cap.set(
-                cv2.CAP_PROP_EXPOSURE, -4
-            )  # Set exposure to a reasonable value
-        elif platform_name == "darwin":
-            self.cap = cv2.VideoCapture(0)
-            print("Using default backend for macOS")
-        elif platform_name == "linux":
-            self.cap = cv2.VideoCapture(self.camera_index, cv2.CAP_V4L2)
+        # Reduced decode: fetch the compressed MJPEG buffers and decode them
+        # at the smallest resolution the current display zoom needs
+        self.reduced_decode = reduced_decode
+        self.reduction = 1
+        self.display_zoom = 1.0
+        self.full_resolution = False
+
+        # Grayscale mode: frames are decoded to (or converted to) 2-D
+        # single-channel luminance, a third of the BGR size
+        self.grayscale = False
+
+        # With decode_workers > 0 this thread only grabs compressed frames
+        # and a pool of workers decodes them (reduced decode mode only)
+        self.decode_workers = decode_workers
+        self.decode_pool = None
+
+        # Decoded frames are read into recycled buffers: one being filled,
+        # one in the mailbox, one on screen and a spare
+        self.buffers = BufferPool(4)
+        self.frame_shape = None
+
+        # Temporal averaging of the published frames (count 1 = off)
+        self.averager = FrameAverager()
+
+        # Dark/flat calibration applied in place to every frame (None = off),
+        # and the master dark or flat being captured, if any
+        self.calibration = None
+        self.master_capture = None
+
+        # Focus aid: sharpness of every frame in a (centre, size) ROI, in
+        # sensor pixels (None = off), the running focus sweep and the focus
+        # position it wants set from the capture loop
+        self.focus_roi = None
+        self.focus_sweep = None
+        self.focus_request = None
+
+        # Camera property changes from the settings dialog, applied by the
+        # capture loop between frames (the loop owns the device)
+        self.properties = PropertyQueue()
+
+        # Frames may be published from several decode workers: the averager,
+        # the master capture and the focus sweep are updated under this lock
+        self.publish_lock = threading.Lock()
+
+    # Called from the GUI thread when the display zoom changes
+    def set_display_zoom(self, zoom):
+        self.display_zoom = zoom
+        self.update_reduction()
+
+    # Force full resolution decoding, e.g. while a measurement is running
+    def set_full_resolution(self, enabled):
+        self.full_resolution = enabled
+        self.update_reduction()
+
+    # Called from the GUI thread, takes effect from the next frame
+    def set_grayscale(self, enabled):
+        self.grayscale = enabled
+
+    # Called from the GUI thread, restarts the average
+    def set_averaging(self, count, mode):
+        with self.publish_lock:
+            self.averager.set_mode(mode)
+            self.averager.set_count(count)
+
+    # Called from the GUI thread, takes effect from the next frame
+    def set_calibration(self, calibration):
+        self.calibration = calibration
+
+    # Called from the GUI thread: average the next count frames at full
+    # resolution, uncalibrated, into a master dark or flat. The result is
+    # emitted with masterCaptured.
+    def capture_master(self, kind, count=16):
+        self.master_capture = MasterCapture(kind, count)
+        self.update_reduction()
+
+    # Called from the GUI thread: queue a camera property change, the value
+    # read back is emitted with propertiesRead
+    def set_property(self, prop, value):
+        self.properties.set(prop, value)
+
+    # Called from the GUI thread: read camera properties, the values are
+    # emitted with propertiesRead
+    def read_properties(self, props):
+        self.properties.read(props)
+
+    # Called from the GUI thread, None switches the sharpness metric off
+    def set_focus_roi(self, centre, size=256):
+        self.focus_roi = None if centre is None else (centre, size)
+
+    # Called from the GUI thread: step the focus through the FocusSweep
+    # positions (at full resolution, so scores are comparable). Needs the
+    # device in this process and a focus ROI.
+    def start_focus_sweep(self, sweep):
+        self.focus_sweep = sweep
+        self.update_reduction()
+        self.focus_request = sweep.position()
+
+    def update_reduction(self):
+        if (
+            self.full_resolution
+            or self.master_capture is not None
+            or self.focus_sweep is not None
+        ):
+            self.reduction = 1
         else:
-            raise RuntimeError(f"Unsupported platform: {platform_name}")
+            self.reduction = choose_reduction(self.display_zoom)
 
-        # Set MJPEG codec and resolution
-        self.cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter.fourcc(*"MJPG"))
-        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 3264)
-        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 2448)
-        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 3)  # Set buffer size to 1 for low latency
+    def run(self):
+        opened = self.source.open(encoded=self.reduced_decode)
+        # device handle for the camera settings dialog (None unless live)
+        self.cap = self.source.cap
+        self.capabilities = self.source.capabilities
+
+        if self.reduced_decode and self.decode_workers > 0:
+            self.decode_pool = DecodePool(self.decode_workers, self.publish)
 
-        self.running = self.cap.isOpened()
+        self.running = opened
+        seq = 0
+        stats = pipeline_stats
         while self.running:
-            ret, frame = self.cap.read()
-            if ret:
-                self.frameCaptured.emit(frame)
-        self.cap.release()
+            # queued changes first: a focus sweep starts with autofocus off
+            if self.properties.pending():
+                writes, reads = self.properties.take()
+                values = self.source.apply_properties(writes, reads)
+                if values:
+                    self.propertiesRead.emit(writes, values)
+            if self.focus_request is not None:
+                self.move_focus()
+            # Until the first decoded frame gives the shape, and for encoded
+            # reads, the source allocates the frame itself
+            buffer, release = None, None
+            if self.frame_shape is not None and not self.reduced_decode:
+                buffer, release = self.buffers.acquire(self.frame_shape)
+            read_start = time.perf_counter()
+            ret, image = self.source.read(buffer)
+            if release is not None and (not ret or image is not buffer):
+                release()  # not read into the buffer, give it back
+                release = None
+            if not ret:
+                continue
+            timestamp = time.perf_counter()
+            if stats.enabled:
+                stats.add("read", read_start, timestamp)
+            seq += 1
+            self.frames_read = seq
+            if is_encoded(image):
+                if self.decode_pool:
+                    self.decode_pool.submit(
+                        image, seq, timestamp, self.reduction, self.grayscale
+                    )
+                    continue
+                reduction = self.reduction
+                image = decode_jpeg(image, reduction, self.grayscale)
+                if image is None:
+                    continue  # corrupt JPEG from the device, skip it
+                if stats.enabled:
+                    stats.add("decode", timestamp)
+                self.publish(Frame(image, seq, timestamp, scale=1.0 / reduction))
+            else:
+                if self.reduced_decode:
+                    print("Backend returned decoded frames, reduced decode disabled")
+                    self.reduced_decode = False
+                self.frame_shape = image.shape
+                if self.grayscale and image.ndim == 3:
+                    image, release = self.to_grayscale(image, release)
+                    if stats.enabled:
+                        stats.add("decode", timestamp)
+                self.publish(Frame(image, seq, timestamp, on_release=release))
+
+        if self.decode_pool:
+            self.decode_pool.close()
+            print(f"Decode pool stats: {self.decode_pool.stats()}")
+        print(f"Frame buffer stats: {self.buffers.stats()}")
         self.cap = None
+        self.source.close()
+
+    # Set the focus position the sweep asked for; runs in the capture loop,
+    # which owns the device
+    def move_focus(self):
+        sweep = self.focus_sweep
+        position, self.focus_request = self.focus_request, None
+        if sweep is None:
+            return
+        if self.cap is not None:
+            writes = {cv2.CAP_PROP_FOCUS: position}
+            if not sweep.scores:
+                # the first position, V4L2 ignores the focus under autofocus
+                writes = {cv2.CAP_PROP_AUTOFOCUS: 0, cv2.CAP_PROP_FOCUS: position}
+            values = self.source.apply_properties(writes)
+            if values:
+                self.propertiesRead.emit(writes, values)
+        with self.publish_lock:
+            sweep.moved(self.frames_read)
+        if sweep.done:
+            self.focus_sweep = None
+            self.update_reduction()
+            self.focusSweepDone.emit(sweep)
+
+    # Convert a decoded BGR frame into a pooled single-channel buffer and
+    # give the BGR buffer back. Returns the gray image and its release.
+    def to_grayscale(self, image, release):
+        gray, gray_release = self.buffers.acquire(image.shape[:2])
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=gray)
+        if release is not None:
+            release()
+        return gray, gray_release
+
+    # Hand a decoded frame to the GUI. Only the newest frame is kept, so a
+    # slow painter can never queue up old frames behind the current one.
+    # Called from this thread or from the decode workers.
+    def publish(self, frame):
+        if self.master_capture is not None:
+            self.add_master_frame(frame)
+        calibration = self.calibration
+        if calibration is not None:
+            start = time.perf_counter()
+            calibration.apply(frame.image)
+            if pipeline_stats.enabled:
+                pipeline_stats.add("calibrate", start)
+        if self.focus_roi is not None:
+            frame.sharpness = sharpness(frame.image, frame.scale, *self.focus_roi)
+            sweep = self.focus_sweep
+            if sweep is not None:
+                with self.publish_lock:
+                    if sweep.add(frame.seq, frame.sharpness):
+                        self.focus_request = (
+                            sweep.best if sweep.done else sweep.position()
+                        )
+        if self.averager.enabled:
+            frame = self.average(frame)
+        if pipeline_stats.enabled:
+            frame.posted = time.perf_counter()
+        if self.mailbox.post(frame):
+            self.frameAvailable.emit()
+
+    def add_master_frame(self, frame):
+        capture = self.master_capture
+        if capture is None or frame.scale != 1.0:
+            return  # decoded before the switch to full resolution
+        with self.publish_lock:
+            if self.master_capture is not capture:
+                return  # completed by another decode worker
+            done = capture.add(frame.image)
+            if done:
+                self.master_capture = None
+        if done:
+            self.masterCaptured.emit(capture)
+
+    # Replace a frame by the average of the latest frames, in a pooled
+    # buffer. A full resolution frame is first reduced to the resolution the
+    # display zoom needs (unless full resolution is forced), which also
+    # makes the averaging cheaper.
+    def average(self, frame):
+        start = time.perf_counter()
+        image = frame.image
+        factor = max(1, round(frame.scale * self.reduction))
+        h, w = image.shape[:2]
+        shape = (h // factor, w // factor) + image.shape[2:]
+        out, release = self.buffers.acquire(shape)
+        if out is None:
+            out = np.empty(shape, np.uint8)
+        if factor > 1:
+            image = image[: shape[0] * factor, : shape[1] * factor]
+            image = cv2.resize(
+                image, shape[1::-1], dst=out, interpolation=cv2.INTER_AREA
+            )
+        with self.publish_lock:
+            self.averager.add(image, out)
+        averaged = Frame(
+            out, frame.seq, frame.timestamp, frame.scale / factor, on_release=release
+        )
+        averaged.sharpness = frame.sharpness
+        frame.release()
+        if pipeline_stats.enabled:
+            pipeline_stats.add("average", start)
+        return averaged
+
+    # Frames queued between source and display, and frames dropped so far,
+    # for the diagnostics HUD
+    def pipeline_status(self):
+        mailbox = self.mailbox.stats()
+        queued = mailbox["pending"]
+        dropped = mailbox["superseded"]
+        if self.decode_pool:
+            pool = self.decode_pool.stats()
+            queued += pool["in_flight"]
+            dropped += pool["dropped_backlog"]
+        return {"queued": queued, "dropped": dropped}
 
     def stop(self):
         self.running = False
         self.wait()
 
 
+class ProcessCameraThread(CameraThread):
+    """
+    Camera thread whose capture and decode run in a separate process, so the
+    work never contends for the GIL with the Qt event loop. Frames arrive in
+    a shared memory ring (framering.py); this thread only turns slot indices
+    into zero-copy Frames and returns each slot when the frame is released.
+    """
+
+    def __init__(self, source, reduced_decode=False, slots=4):
+        super().__init__(source, reduced_decode)
+        self.slots = slots
+        self.control = None
+        # Control messages come from the GUI thread and, for ("free", slot),
+        # from whichever thread releases a frame; Connection.send is not
+        # thread safe
+        self.control_lock = threading.Lock()
+        self.dropped = 0
+
+    # The reduction and the grayscale mode are applied by the capture process
+    def update_reduction(self):
+        super().update_reduction()
+        self.send_control(("reduction", self.reduction))
+
+    def set_grayscale(self, enabled):
+        super().set_grayscale(enabled)
+        self.send_control(("grayscale", enabled))
+
+    # The device is owned by the capture process, which coalesces and applies
+    # the changes the same way
+    def set_property(self, prop, value):
+        self.send_control(("property", prop, value))
+
+    def read_properties(self, props):
+        self.send_control(("read", tuple(props)))
+
+    def pipeline_status(self):
+        status = super().pipeline_status()
+        status["dropped"] += self.dropped  # ring full, known once stopped
+        return status
+
+    def send_control(self, message):
+        with self.control_lock:
+            if self.control is not None:
+                try:
+                    self.control.send(message)
+                except (OSError, ValueError):
+                    pass  # the capture process is gone
+
+    def run(self):
+        # spawn: forking a process that runs Qt threads is not safe
+        context = multiprocessing.get_context("spawn")
+        try:
+            ring = FrameRing(self.slots, SLOT_BYTES)
+        except OSError as e:
+            print(f"Cannot allocate the shared memory frame ring: {e}")
+            return
+        frames_in, frames_out = context.Pipe(duplex=False)
+        control_in, control_out = context.Pipe(duplex=False)
+        process = context.Process(
+            target=capture_main,
+            args=(
+                self.source,
+                ring.name,
+                self.slots,
+                SLOT_BYTES,
+                self.reduced_decode,
+                frames_out,
+                control_in,
+            ),
+            daemon=True,
+        )
+        process.start()
+        self.control = control_out
+        self.send_control(("reduction", self.reduction))
+        self.send_control(("grayscale", self.grayscale))
+
+        self.running = True
+        while self.running:
+            if not frames_in.poll(0.1):
+                if not process.is_alive():
+                    break
+                continue
+            message = frames_in.recv()
+            if message[0] == "frame":
+                _, slot, seq, timestamp, shape, scale, read_start, decoded = message
+                self.frames_read = seq
+                if pipeline_stats.enabled:
+                    pipeline_stats.add("read", read_start, timestamp)
+                    if decoded is not None:
+                        pipeline_stats.add("decode", timestamp, decoded)
+                self.publish(
+                    Frame(
+                        ring.view(slot, shape),
+                        seq,
+                        timestamp,
+                        scale,
+                        on_release=lambda slot=slot: self.send_control(("free", slot)),
+                    )
+                )
+            elif message[0] == "capabilities":
+                self.capabilities = message[1]
+            elif message[0] == "properties":
+                if message[2]:
+                    self.propertiesRead.emit(message[1], message[2])
+            elif message[0] == "opened" and not message[1]:
+                print(f"Capture process could not open {self.source}")
+                break
+            elif message[0] == "stopped":
+                self.dropped = message[1]
+                break
+
+        self.send_control(("stop",))
+        process.join(2.0)
+        if process.is_alive():
+            process.terminate()
+        with self.control_lock:
+            self.control = None
+        print(f"Capture process stopped, {self.dropped} frames dropped (ring full)")
+
+        self.mailbox.clear()
+        ring.unlink()
+        ring.close()
+
+
+# Display frame rate caps offered by comboDisplayFps (0 = refresh rate)
+DISPLAY_FPS_CHOICES = (0, 30, 15, 5)
+
+
 class MainWindow(QMainWindow):
+    # Emitted from the discovery thread with the camera index (None if no
+    # camera was found)
+    cameraDiscovered = pyqtSignal(object)
+
     def __init__(self, ui):
         super().__init__()
         self.ui = ui
         self.controls_dialog = None
+        # Full camera enumeration running in the background, if any
+        self.camera_discovery = None
+        self.closing = False
+        self.cameraDiscovered.connect(self.camera_found)
 
         # normalize the path of the .ui file
         asset_file_path = os.path.join(os.path.dirname(__file__), "asset", "logo.png")
@@ -90,9 +519,45 @@ class MainWindow(QMainWindow):
         self.ui.sliderThicknessCross.valueChanged.connect(self.cross_thickness_changed)
         self.ui.sliderCrossAngle.valueChanged.connect(self.cross_angle_changed)
 
+        # Event handlers for the processing section
+        self.ui.checkBoxHud.stateChanged.connect(self.toggle_diagnostics)
+        self.ui.btnExportStats.clicked.connect(self.export_pipeline_stats)
+        self.ui.checkBoxGrayscale.stateChanged.connect(self.toggle_grayscale)
+        self.ui.comboDisplayFps.currentIndexChanged.connect(self.display_fps_changed)
+        self.ui.checkBoxAnalysis.stateChanged.connect(self.toggle_analysis)
+        self.ui.checkBoxTracking.stateChanged.connect(self.toggle_tracking)
+        self.ui.checkBoxConcentricity.stateChanged.connect(self.toggle_concentricity)
+        self.ui.checkBoxStarTest.stateChanged.connect(self.toggle_star_test)
+        self.ui.spinBoxAverage.valueChanged.connect(self.averaging_changed)
+        self.ui.comboAverageMode.currentIndexChanged.connect(self.averaging_changed)
+        self.ui.checkBoxCalibration.stateChanged.connect(self.update_calibration)
+        self.ui.btnCaptureDark.clicked.connect(lambda: self.capture_master("dark"))
+        self.ui.btnCaptureFlat.clicked.connect(lambda: self.capture_master("flat"))
+        self.ui.checkBoxHistogram.stateChanged.connect(self.toggle_histogram)
+
         # Objects for camera and video window
         self.camera_thread = None
         self.video_window = None
+        # Collimation analysis worker, runs while "Auto analysis" is checked
+        self.analysis_thread = None
+        # Master dark and flat, loaded when the camera starts
+        self.calibration = None
+        # Luminance histogram worker, runs while "Histogram" is checked
+        self.histogram_thread = None
+
+        # Decode the MJPEG stream at the resolution the display zoom needs.
+        # Raw MJPEG buffers are only available through the V4L2 backend.
+        self.reduced_decode = platform.system().lower() == "linux"
+        # Decode workers for the reduced decode mode, leaving one core for
+        # the camera thread and the GUI
+        self.decode_workers = max(1, (os.cpu_count() or 2) - 1)
+        # Run capture and decode in a separate process instead (shared
+        # memory frame ring, no GIL contention with the GUI)
+        self.capture_process = False
+        # Frame shown in the video window, released when replaced
+        self.displayed_frame = None
+        # FrameSource to use instead of the camera (replay or synthetic)
+        self.frame_source = None
 
         # set Events for circles sliders and checkboxes
         self.connect_overlay_controls()
@@ -243,6 +708,7 @@ class MainWindow(QMainWindow):
             x = self.ui.sliderOffsetX.value()
             y = self.ui.sliderOffsetY.value()
             self.video_window.set_center_offset(x, y)
+            self.update_analysis_centre()
 
     def toggle_overlay_offset(self, state):
         enabled = state == 2  # 2 = checked
@@ -252,6 +718,222 @@ class MainWindow(QMainWindow):
                 self.update_overlay_offset()
             else:
                 self.video_window.set_center_offset(0, 0)  # reset offset
+                self.update_analysis_centre()
+
+    # Grayscale mode: luminance-only frames, overlays stay in colour
+    def toggle_grayscale(self, state):
+        if self.camera_thread:
+            self.camera_thread.set_grayscale(state == 2)  # 2 = checked
+
+    # Temporal averaging of the last N frames (1 = off), for display and
+    # analysis alike
+    def averaging_changed(self):
+        if self.camera_thread:
+            self.camera_thread.set_averaging(
+                self.ui.spinBoxAverage.value(),
+                AVERAGE_MODES[self.ui.comboAverageMode.currentIndex()],
+            )
+
+    # Dark/flat calibration, applied by the capture thread while checked
+    def update_calibration(self):
+        if self.calibration is None:
+            return
+        if self.camera_thread:
+            enabled = self.ui.checkBoxCalibration.isChecked()
+            self.camera_thread.set_calibration(self.calibration if enabled else None)
+        self.ui.checkBoxCalibration.setText(
+            f"Calibrate ({self.calibration.describe()})"
+        )
+
+    # Average the next frames into a master: a dark with the collimator
+    # covered, a flat with it evenly lit
+    def capture_master(self, kind):
+        if self.camera_thread:
+            print(f"Capturing master {kind}")
+            self.camera_thread.capture_master(kind)
+
+    def master_captured(self, capture):
+        if not self.camera_thread or self.calibration is None:
+            return
+        self.camera_thread.update_reduction()  # back to the display resolution
+        master = capture.master()
+        try:
+            if capture.kind == "dark":
+                self.calibration = self.calibration.with_dark(master)
+            else:
+                self.calibration = self.calibration.with_flat(master)
+        except OSError as e:
+            print(f"Cannot save the master {capture.kind}: {e}")
+            return
+        print(f"Saved master {capture.kind} of {capture.added} frames {master.shape}")
+        self.update_calibration()
+
+    # Cap the repaint rate, e.g. to save battery at the telescope. The camera
+    # keeps capturing at full rate.
+    def display_fps_changed(self, index):
+        if self.video_window:
+            self.video_window.set_max_fps(DISPLAY_FPS_CHOICES[index])
+
+    # Automatic collimation analysis in a worker thread. While it runs the
+    # camera decodes at full resolution, so edges are refined on sensor pixels.
+    def toggle_analysis(self, state):
+        if state == 2:  # 2 = checked
+            self.start_analysis()
+        else:
+            self.stop_analysis()
+
+    def start_analysis(self):
+        if self.analysis_thread or not self.camera_thread:
+            return
+        self.analysis_thread = AnalysisThread()
+        self.update_analysis_centre()
+        self.analysis_thread.set_tracking(self.ui.checkBoxTracking.isChecked())
+        self.analysis_thread.set_concentricity(
+            self.ui.checkBoxConcentricity.isChecked()
+        )
+        self.analysis_thread.set_star_test(self.ui.checkBoxStarTest.isChecked())
+        self.analysis_thread.resultReady.connect(self.analysis_result)
+        self.camera_thread.set_full_resolution(True)
+        self.analysis_thread.start()
+
+    def stop_analysis(self):
+        if not self.analysis_thread:
+            return
+        self.analysis_thread.stop()
+        print(f"Analysed {self.analysis_thread.analysed} frames")
+        self.analysis_thread = None
+        if self.camera_thread:
+            self.camera_thread.set_full_resolution(False)
+        if self.video_window:
+            self.video_window.set_analysis(None)
+        self.ui.lblAnalysis.setText("-")
+        self.ui.lblTracking.setText("-")
+        self.ui.lblConcentricity.setText("-")
+        self.ui.lblStarTest.setText("-")
+
+    # Feature offsets are measured from center_focus, the radial profile is
+    # unwrapped around the overlay centre (center_focus plus the offset)
+    def update_analysis_centre(self):
+        if self.analysis_thread and self.video_window:
+            self.analysis_thread.set_center_focus(*self.video_window.center_focus)
+            self.analysis_thread.set_center_offset(*self.video_window.center_offset)
+
+    # Tracking: refine the features around their last positions instead of
+    # searching the whole frame every time
+    def toggle_tracking(self, state):
+        if self.analysis_thread:
+            self.analysis_thread.set_tracking(state == 2)  # 2 = checked
+
+    # Concentricity: tilt of the secondary against the primary outline from a
+    # polar unwrap, a number to drive to zero
+    def toggle_concentricity(self, state):
+        if self.analysis_thread:
+            self.analysis_thread.set_concentricity(state == 2)  # 2 = checked
+        if state != 2:
+            self.ui.lblConcentricity.setText("-")
+
+    # Star test: a defocused star instead of the collimation features
+    def toggle_star_test(self, state):
+        if self.analysis_thread:
+            self.analysis_thread.set_star_test(state == 2)  # 2 = checked
+        self.ui.lblAnalysis.setText("-")
+        self.ui.lblStarTest.setText("-")
+
+    def analysis_result(self, result):
+        if not self.analysis_thread:
+            return  # queued before the analysis was stopped
+        if self.video_window:
+            self.video_window.set_analysis(result)
+        if result["star_test"]:
+            if result["shadow_offset"] is not None:
+                dx, dy = result["shadow_offset"]
+                self.ui.lblStarTest.setText(
+                    f"Shadow {dx:+.1f} {dy:+.1f} px ({result['offset_ratio']:.1%})"
+                )
+            else:
+                self.ui.lblStarTest.setText("not found")
+            return
+        parts = []
+        for key, name in (("secondary_offset", "Sec"), ("marker_offset", "Mark")):
+            if result[key] is not None:
+                dx, dy = result[key]
+                parts.append(f"{name} {dx:+.1f} {dy:+.1f}")
+        self.ui.lblAnalysis.setText("  ".join(parts) + " px" if parts else "not found")
+        tracking = result["tracking"]
+        if tracking["hit_rate"] is not None:
+            costs = [
+                f"{name} {tracking[key]:.1f} ms"
+                for key, name in (("track_ms", "track"), ("full_ms", "full"))
+                if tracking[key] is not None
+            ]
+            self.ui.lblTracking.setText(
+                f"hits {tracking['hit_rate']:.0%}  " + "  ".join(costs)
+            )
+        concentricity = result["concentricity"]
+        if concentricity is not None:
+            if concentricity["tilt"] is not None:
+                dx, dy = concentricity["tilt"]
+                mx, my = concentricity["decentre"]
+                self.ui.lblConcentricity.setText(
+                    f"Tilt {dx:+.1f} {dy:+.1f}  Decentre {mx:+.1f} {my:+.1f} px"
+                )
+            else:
+                self.ui.lblConcentricity.setText("not found")
+
+    # Live luminance histogram with the clipped and crushed fractions, as
+    # feedback while setting the exposure by hand
+    def toggle_histogram(self, state):
+        if state == 2:  # 2 = checked
+            self.start_histogram()
+        else:
+            self.stop_histogram()
+
+    def start_histogram(self):
+        if self.histogram_thread or not self.camera_thread:
+            return
+        self.histogram_thread = HistogramThread()
+        self.histogram_thread.resultReady.connect(self.histogram_result)
+        self.histogram_thread.start()
+
+    def stop_histogram(self):
+        if not self.histogram_thread:
+            return
+        self.histogram_thread.stop()
+        self.histogram_thread = None
+        if self.video_window:
+            self.video_window.set_histogram(None)
+        self.ui.lblHistogram.setText("-")
+
+    def histogram_result(self, result):
+        if not self.histogram_thread:
+            return  # queued before the histogram was stopped
+        if self.video_window:
+            self.video_window.set_histogram(result)
+        self.ui.lblHistogram.setText(
+            f"clip {result['clipped']:.2%}  crush {result['crushed']:.2%}"
+            f"  ({result['duration'] * 1000:.1f} ms)"
+        )
+
+    # Diagnostics: per-stage timings are only recorded while the HUD is on
+    def toggle_diagnostics(self, state):
+        enabled = state == 2  # 2 = checked
+        if enabled:
+            pipeline_stats.clear()
+        pipeline_stats.set_enabled(enabled)
+        if self.video_window:
+            self.video_window.set_hud_enabled(enabled)
+
+    def export_pipeline_stats(self):
+        path, _ = QFileDialog.getSaveFileName(
+            self, "Export pipeline stats", "pipeline_stats.csv", "CSV files (*.csv)"
+        )
+        if not path:
+            return
+        try:
+            rows = pipeline_stats.write_csv(path)
+            print(f"Exported {rows} stage timings to {path}")
+        except OSError as e:
+            print(f"Cannot write {path}: {e}")
 
     def read_focus_offset(self, path="focus.txt"):
         try:
@@ -273,11 +955,43 @@ class MainWindow(QMainWindow):
         and set the center focus offset from the file set the properties for circles and cross """
 
     def start_camera(self):
-        if self.camera_thread:
+        if self.camera_thread or self.camera_discovery:
+            return
+        if self.frame_source is not None:
+            # replay or synthetic source, no camera discovery
+            self.start_source(self.frame_source)
             return
-        # Trova l'indice della camera
+        # Trova l'indice della camera: the cached camera, without enumerating
+        camera_index = find_camera()
+        if camera_index is None:
+            # not cached or gone: enumerate in the background, camera_found
+            # continues
+            print("Searching for the camera...")
+            self.ui.btnOpenCamera.setEnabled(False)
+            # A daemon thread: the enumeration cannot be interrupted, and
+            # must not hold up closing the window
+            self.camera_discovery = threading.Thread(
+                target=self.discover_camera, name="camera discovery", daemon=True
+            )
+            self.camera_discovery.start()
+            return
+        self.camera_found(camera_index)
+
+    # Full enumeration, which can take seconds with many video devices; runs
+    # in the discovery thread
+    def discover_camera(self):
         camera_index = find_camera_index_by_name_substring()
+        try:
+            self.cameraDiscovered.emit(camera_index)
+        except RuntimeError:
+            pass  # the window is gone
 
+    def camera_found(self, camera_index):
+        if self.closing:
+            return  # discovery finished after the window was closed
+        if self.camera_discovery:
+            self.camera_discovery = None
+            self.ui.btnOpenCamera.setEnabled(True)
         if camera_index is None:
             msg = QMessageBox(self)
             msg.setIcon(QMessageBox.Icon.Warning)
@@ -287,83 +1001,135 @@ class MainWindow(QMainWindow):
             msg.exec()
             return
 
+        print(f"Start camera with index {camera_index}")
+        self.start_source(CameraSource(camera_index))
+
+    def start_source(self, source):
+        # Initialize the camera thread and video window
+        if self.capture_process:
+            self.camera_thread = ProcessCameraThread(source, self.reduced_decode)
         else:
-            print(f"Start camera with index {camera_index}")
-            # Initialize the camera thread and video window
-            self.camera_thread = CameraThread(camera_index)
-            self.camera_thread.frameCaptured.connect(self.update_frame)
-            self.camera_thread.start()
-            self.video_window = VideoWindow()
-
-            center_offset = self.read_focus_offset()
-            print(f"Read offset parameter from: {center_offset}")
-            self.video_window.set_center_focus(center_offset[0], center_offset[1])
-
-            # set properties for circles and cross
-            self.video_window.set_circle_property(
-                0, "radius", self.ui.sliderRadius_1.value()
-            )
-            self.video_window.set_circle_property(
-                0, "thickness", self.ui.sliderThickness_1.value()
-            )
-            self.video_window.set_circle_property(
-                0, "visible", self.ui.checkBox_1.isChecked()
-            )
-            self.video_window.set_circle_property(
-                1, "radius", self.ui.sliderRadius_2.value()
-            )
-            self.video_window.set_circle_property(
-                1, "thickness", self.ui.sliderThickness_2.value()
-            )
-            self.video_window.set_circle_property(
-                1, "visible", self.ui.checkBox_2.isChecked()
-            )
-            self.video_window.set_circle_property(
-                2, "radius", self.ui.sliderRadius_3.value()
-            )
-            self.video_window.set_circle_property(
-                2, "thickness", self.ui.sliderThickness_3.value()
-            )
-            self.video_window.set_circle_property(
-                2, "visible", self.ui.checkBox_3.isChecked()
-            )
-            self.video_window.set_cross_property(
-                "length", self.ui.sliderCrossLength.value()
+            self.camera_thread = CameraThread(
+                source, self.reduced_decode, self.decode_workers
             )
-            self.video_window.set_cross_property(
-                "thickness", self.ui.sliderThicknessCross.value()
-            )
-            self.video_window.set_cross_property(
-                "angle", self.ui.sliderCrossAngle.value()
-            )
-            self.video_window.set_cross_property(
-                "visible", self.ui.checkBox_4.isChecked()
-            )
-            self.video_window.set_cross_property(
-                "color",
-                getattr(self.ui, "label_color_4")
-                .palette()
-                .color(getattr(self.ui, "label_color_4").backgroundRole()),
-            )
-            self.video_window.show()
-            self.ui.btnOpenCamera.setEnabled(
-                False
-            )  # Disable the button to prevent multiple clicks
+        self.camera_thread.frameAvailable.connect(self.update_frame)
+        self.camera_thread.set_grayscale(self.ui.checkBoxGrayscale.isChecked())
+        self.averaging_changed()
+        self.camera_thread.masterCaptured.connect(self.master_captured)
+        self.calibration = Calibration.load()
+        print(f"Calibration masters: {self.calibration.describe()}")
+        self.update_calibration()
+        self.video_window = VideoWindow()
+        self.camera_thread.set_display_zoom(self.video_window.zoom_factor)
+        self.video_window.zoomChanged.connect(self.camera_thread.set_display_zoom)
+        self.video_window.hud_status = self.camera_thread.pipeline_status
+        self.video_window.set_hud_enabled(self.ui.checkBoxHud.isChecked())
+        self.video_window.set_max_fps(
+            DISPLAY_FPS_CHOICES[self.ui.comboDisplayFps.currentIndex()]
+        )
+        self.camera_thread.start()
+
+        center_offset = self.read_focus_offset()
+        print(f"Read offset parameter from: {center_offset}")
+        self.video_window.set_center_focus(center_offset[0], center_offset[1])
+        if self.ui.checkBoxAnalysis.isChecked():
+            self.start_analysis()
+        if self.ui.checkBoxHistogram.isChecked():
+            self.start_histogram()
+
+        # set properties for circles and cross
+        self.video_window.set_circle_property(
+            0, "radius", self.ui.sliderRadius_1.value()
+        )
+        self.video_window.set_circle_property(
+            0, "thickness", self.ui.sliderThickness_1.value()
+        )
+        self.video_window.set_circle_property(
+            0, "visible", self.ui.checkBox_1.isChecked()
+        )
+        self.video_window.set_circle_property(
+            1, "radius", self.ui.sliderRadius_2.value()
+        )
+        self.video_window.set_circle_property(
+            1, "thickness", self.ui.sliderThickness_2.value()
+        )
+        self.video_window.set_circle_property(
+            1, "visible", self.ui.checkBox_2.isChecked()
+        )
+        self.video_window.set_circle_property(
+            2, "radius", self.ui.sliderRadius_3.value()
+        )
+        self.video_window.set_circle_property(
+            2, "thickness", self.ui.sliderThickness_3.value()
+        )
+        self.video_window.set_circle_property(
+            2, "visible", self.ui.checkBox_3.isChecked()
+        )
+        self.video_window.set_cross_property(
+            "length", self.ui.sliderCrossLength.value()
+        )
+        self.video_window.set_cross_property(
+            "thickness", self.ui.sliderThicknessCross.value()
+        )
+        self.video_window.set_cross_property("angle", self.ui.sliderCrossAngle.value())
+        self.video_window.set_cross_property("visible", self.ui.checkBox_4.isChecked())
+        self.video_window.set_cross_property(
+            "color",
+            getattr(self.ui, "label_color_4")
+            .palette()
+            .color(getattr(self.ui, "label_color_4").backgroundRole()),
+        )
+        self.video_window.show()
+        self.ui.btnOpenCamera.setEnabled(
+            False
+        )  # Disable the button to prevent multiple clicks
 
     # Stop the camera thread and close the video window
     def stop_camera(self):
+        # The analysis and the histogram may hold a frame too
+        self.stop_analysis()
+        self.stop_histogram()
+        if self.video_window:
+            # Drop the frame before the camera thread goes away, it may be a
+            # view into the capture process' shared memory ring
+            self.video_window.set_frame(None)
+            self.video_window.hud_status = None
+        self.release_displayed_frame()
         if self.camera_thread:
             self.camera_thread.stop()
+            print(f"Frame handoff stats: {self.camera_thread.mailbox.stats()}")
             self.camera_thread = None
         if self.video_window:
+            print(f"Repaint stats: {self.video_window.repaint_stats()}")
             self.video_window.close()
             self.video_window = None
             self.ui.btnOpenCamera.setEnabled(True)  # Re-enable the button
 
-    # Update the video frame in the video window
-    def update_frame(self, frame):
+    # Take the newest frame from the camera mailbox and show it
+    def update_frame(self):
+        if not self.camera_thread:
+            return
+        frame = self.camera_thread.mailbox.take()
+        if frame is None:
+            return
+        if frame.posted is not None and pipeline_stats.enabled:
+            pipeline_stats.add("handoff", frame.posted)
+        if self.analysis_thread:
+            self.analysis_thread.submit(frame)
+        if self.histogram_thread:
+            self.histogram_thread.submit(frame)
+        if self.controls_dialog and frame.sharpness is not None:
+            self.controls_dialog.add_sharpness(frame.sharpness)
         if self.video_window:
-            self.video_window.set_frame(frame)
+            self.video_window.set_frame(frame.image, frame.scale, frame.timestamp)
+        # the previous frame is no longer referenced by the video window
+        self.release_displayed_frame()
+        self.displayed_frame = frame
+
+    def release_displayed_frame(self):
+        if self.displayed_frame is not None:
+            self.displayed_frame.release()
+            self.displayed_frame = None
 
     # Update the cross properties in the video window
     def update_cross(self, length=None, thickness=None, angle=None, visible=None):
@@ -411,25 +1177,31 @@ class MainWindow(QMainWindow):
 
     def open_camera_control_dialog(self):
         if platform.system().lower() == "windows":
-            camera_thread = self.camera_thread
-            camera_thread.cap.set(cv2.CAP_PROP_SETTINGS, 1)
+            if self.camera_thread:
+                self.camera_thread.set_property(cv2.CAP_PROP_SETTINGS, 1)
             return
         elif platform.system().lower() == "linux":
-            if not self.controls_dialog:
+            dialog = self.controls_dialog
+            if not dialog or dialog.camera_thread is not self.camera_thread:
+                if dialog:
+                    # bound to a camera thread that is gone
+                    dialog.close()
+                    dialog.deleteLater()
+                center_focus = (
+                    self.video_window.center_focus if self.video_window else None
+                )
                 self.controls_dialog = CameraControlsDialog(
-                    camera_thread=self.camera_thread, parent=self
+                    camera_thread=self.camera_thread,
+                    parent=self,
+                    center_focus=center_focus,
                 )
-                self.controls_dialog.show()
+            self.controls_dialog.show()
 
     def closeEvent(self, event):
 
-        if self.camera_thread:
-            self.camera_thread.stop()
-            self.camera_thread.wait()
-            self.camera_thread = None
-        if self.video_window:
-            self.video_window.close()
-            self.video_window = None
+        # a running camera discovery is left to finish on its own
+        self.closing = True
+        self.stop_camera()
         if self.controls_dialog:
             self.controls_dialog.close()
             self.controls_dialog = None
@@ -0,0 +1,51 @@
+# MJPEG helpers: decode compressed camera frames at a reduced resolution
+import cv2
+import numpy as np
+
+# imdecode flags for each supported size reduction (1/1, 1/2, 1/4, 1/8).
+# libjpeg scales during the IDCT, so a reduced decode is much cheaper than a
+# full decode followed by a resize.
+REDUCED_COLOR_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+# Same for the grayscale mode: libjpeg decodes only the luma channel and
+# skips the chroma upsampling and colour conversion
+REDUCED_GRAYSCALE_FLAGS = {
+    1: cv2.IMREAD_GRAYSCALE,
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+
+def choose_reduction(zoom):
+    """
+    Return the largest size reduction that still gives at least one decoded
+    pixel per screen pixel at the given display zoom.
+    """
+    for reduction in (8, 4, 2):
+        if zoom <= 1.0 / reduction:
+            return reduction
+    return 1
+
+
+def is_encoded(frame):
+    """
+    True if a frame returned by VideoCapture.read() is a raw JPEG buffer
+    (CAP_PROP_CONVERT_RGB = 0) rather than a decoded image.
+    """
+    return frame.dtype == np.uint8 and (frame.ndim == 1 or frame.shape[0] == 1)
+
+
+def decode_jpeg(data, reduction=1, grayscale=False):
+    """
+    Decode a JPEG buffer, reduced by 1, 2, 4 or 8 in each dimension, to BGR
+    or to a single-channel 2-D luminance image.
+    Returns None if the buffer is not a valid image.
+    """
+    flags = REDUCED_GRAYSCALE_FLAGS if grayscale else REDUCED_COLOR_FLAGS
+    return cv2.imdecode(data, flags[reduction])
@@ -1,39 +1,23 @@
+import sys
 import cv2
 
+from camera import camera_device, device_identity
+from capabilities import Capabilities, device_capabilities
 
-def get_properties(cap):
+
+def print_capabilities(capabilities):
     """
-    Test and display OpenCV properties of the video capture device.
+    Display the probed capabilities of the video capture device.
     """
-    # List of properties to demonstrate
-    properties = {
-        "CAP_PROP_POS_MSEC": cv2.CAP_PROP_POS_MSEC,
-        "CAP_PROP_POS_FRAMES": cv2.CAP_PROP_POS_FRAMES,
-        "CAP_PROP_POS_AVI_RATIO": cv2.CAP_PROP_POS_AVI_RATIO,
-        "CAP_PROP_FRAME_WIDTH": cv2.CAP_PROP_FRAME_WIDTH,
-        "CAP_PROP_FRAME_HEIGHT": cv2.CAP_PROP_FRAME_HEIGHT,
-        "CAP_PROP_FPS": cv2.CAP_PROP_FPS,
-        "CAP_PROP_FOURCC": cv2.CAP_PROP_FOURCC,
-        "CAP_PROP_FRAME_COUNT": cv2.CAP_PROP_FRAME_COUNT,
-        "CAP_PROP_BRIGHTNESS": cv2.CAP_PROP_BRIGHTNESS,
-        "CAP_PROP_CONTRAST": cv2.CAP_PROP_CONTRAST,
-        "CAP_PROP_SATURATION": cv2.CAP_PROP_SATURATION,
-        "CAP_PROP_HUE": cv2.CAP_PROP_HUE,
-        "CAP_PROP_GAIN": cv2.CAP_PROP_GAIN,
-        "CAP_PROP_EXPOSURE": cv2.CAP_PROP_EXPOSURE,
-        "CAP_PROP_CONVERT_RGB": cv2.CAP_PROP_CONVERT_RGB,
-        "CAP_PROP_ZOOM": cv2.CAP_PROP_ZOOM,
-        "CAP_PROP_FOCUS": cv2.CAP_PROP_FOCUS,
-        "CAP_PROP_WHITE_BALANCE_BLUE_U": cv2.CAP_PROP_WHITE_BALANCE_BLUE_U,
-    }
-
-    print("\nTesting Video Capture Properties:")
-    for prop_name, prop_id in properties.items():
-        value = cap.get(prop_id)
-        if value == -1:
-            print(f"{prop_name}: Not supported by this device.")
-        else:
-            print(f"{prop_name}: {value}")
+    print(f"\nCapabilities of {capabilities.identity} ({capabilities.backend}):")
+    for name, control in capabilities.controls.items():
+        print(
+            f"{name}: {control['value']} "
+            f"(range {control['min']}..{control['max']}, step {control['step']})"
+        )
+    for fourcc, sizes in capabilities.formats.items():
+        for size, rates in sizes.items():
+            print(f"{fourcc} {size}: {', '.join(f'{r:g}' for r in rates)} fps")
 
 
 def real_time_demo(cap):
@@ -107,8 +91,15 @@ if __name__ == "__main__":
 
     print(f"Using backend: {cap.getBackendName()}")
 
-    # Demonstrate properties
-    get_properties(cap)
+    # Device capabilities, from the cache the application uses (probed on
+    # the first run, or again with --probe)
+    identity = device_identity(video_source)
+    if "--probe" in sys.argv:
+        capabilities = Capabilities.probe(cap, identity, camera_device(video_source))
+        capabilities.save()
+    else:
+        capabilities = device_capabilities(cap, identity, camera_device(video_source))
+    print_capabilities(capabilities)
 
     # Real-time demonstration
     real_time_demo(cap)
@@ -1,13 +1,96 @@
-import math, os
+import math, os, time
 from PyQt6.QtWidgets import QWidget
-from PyQt6.QtGui import QImage, QPixmap, QPainter, QColor, QPen, QIcon
-from PyQt6.QtCore import Qt, QPointF, QLineF
+from PyQt6.QtGui import (
+    QImage,
+    QPixmap,
+    QPainter,
+    QPainterPath,
+    QColor,
+    QPen,
+    QIcon,
+)
+from PyQt6.QtCore import Qt, QPointF, QLineF, QRectF, QTimer, pyqtSignal
+from PyQt6 import sip
 
 import cv2
 import numpy as np
 
+from instrumentation import pipeline_stats
+
+
+def resize_for_display(image, width, height, zoom):
+    """
+    Resize an image (or a crop view of one) to width x height.
+    Downscaling uses INTER_AREA, first by the largest integer factor (OpenCV
+    fast path) and then a small linear step for the remaining fraction, which
+    is several times faster than a single fractional INTER_AREA resize.
+    Upscaling uses nearest neighbour to keep sensor pixels crisp.
+    """
+    if zoom >= 1.0:
+        return cv2.resize(image, (width, height), interpolation=cv2.INTER_NEAREST)
+
+    factor = int(1.0 / zoom)
+    if factor >= 2:
+        h, w = image.shape[:2]
+        # trim to a multiple of the factor so OpenCV takes the integer path
+        image = image[: h - h % factor, : w - w % factor]
+        image = cv2.resize(
+            image,
+            (image.shape[1] // factor, image.shape[0] // factor),
+            interpolation=cv2.INTER_AREA,
+        )
+    if image.shape[1] == width and image.shape[0] == height:
+        return image
+    if factor >= 2:
+        return cv2.resize(image, (width, height), interpolation=cv2.INTER_LINEAR)
+    return cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+
+
+def bgr_to_qimage(image):
+    """
+    Wrap a BGR uint8 image in a Format_BGR888 QImage without copying.
+    Works for crop views too: the row stride is passed as bytesPerLine.
+    The QImage reads the array memory in place, so the caller must keep the
+    array alive for as long as the QImage is used.
+    """
+    if image.strides[1:] != (3, 1):
+        image = np.ascontiguousarray(image)
+    h, w = image.shape[:2]
+    qimg = QImage(
+        sip.voidptr(image.ctypes.data),
+        w,
+        h,
+        image.strides[0],
+        QImage.Format.Format_BGR888,
+    )
+    return qimg, image
+
+
+def gray_to_qimage(image):
+    """
+    Wrap a 2-D uint8 luminance image in a Format_Grayscale8 QImage without
+    copying, with the same lifetime rule as bgr_to_qimage().
+    """
+    if image.strides[1] != 1:
+        image = np.ascontiguousarray(image)
+    h, w = image.shape
+    qimg = QImage(
+        sip.voidptr(image.ctypes.data),
+        w,
+        h,
+        image.strides[0],
+        QImage.Format.Format_Grayscale8,
+    )
+    return qimg, image
+
 
 class VideoWindow(QWidget):
+    # Emitted with the new zoom factor when the user zooms with the wheel
+    zoomChanged = pyqtSignal(float)
+    # Emitted after the first paint of each frame with (frame_id, capture
+    # timestamp, paint timestamp), both time.perf_counter()
+    framePainted = pyqtSignal(int, float, float)
+
     def __init__(self):
         super().__init__()
 
@@ -32,6 +115,53 @@ class VideoWindow(QWidget):
         self.frame = None
         self.zoom_factor = 0.39  # zoom base
 
+        # Size of self.frame relative to the sensor (0.5 = decoded at half
+        # resolution). Overlay and viewport coordinates stay in sensor pixels.
+        self.frame_scale = 1.0
+
+        # Sequence number of self.frame, bumped by set_frame()
+        self.frame_id = 0
+        # perf_counter() when self.frame was captured, and last painted frame_id
+        self.frame_timestamp = 0.0
+        self._painted_frame_id = 0
+
+        # Scaled pixmap of the visible frame area and the key it was built for
+        self._frame_cache = None
+        self._frame_cache_key = None
+
+        # Cached transparent overlay layer (circles, cross, zoom label)
+        self._overlay = None
+        self._overlay_key = None
+        self._overlay_dirty = True
+
+        # Diagnostics HUD with the pipeline stage timings. hud_status is an
+        # optional callable returning {"queued": n, "dropped": n}.
+        self.hud_enabled = False
+        self.hud_status = None
+
+        # Latest result of the collimation analysis (analysis.analyse_frame)
+        self.analysis = None
+
+        # Latest luminance histogram (histogram.luminance_histogram) and its
+        # outline as a path in bin/height units, built once per histogram
+        self.histogram = None
+        self._histogram_path = None
+
+        # Repaint scheduler: every invalidation goes through
+        # schedule_repaint(), which paints at most max_fps times per second
+        # (0 = the display refresh rate). Capture is not affected.
+        self.max_fps = 0
+        self._repaint_timer = QTimer(self)
+        self._repaint_timer.setSingleShot(True)
+        self._repaint_timer.setTimerType(Qt.TimerType.PreciseTimer)
+        self._repaint_timer.timeout.connect(self.update)
+        self._last_paint = 0.0
+
+        # Counters (read them with repaint_stats())
+        self.repaint_requests = 0
+        self.repaints_coalesced = 0  # merged into an already scheduled paint
+        self.repaints = 0
+
         # Overlay properties for 3 circles (default)
         self.circles = [
             {
@@ -70,12 +200,143 @@ class VideoWindow(QWidget):
         self.center_offset = (0, 0)
         self.offset_enabled = False
 
-    def set_frame(self, frame):
+    # Minimum time between two paints for the current cap
+    def repaint_interval(self):
+        fps = self.max_fps
+        if fps <= 0:
+            screen = self.screen()
+            fps = screen.refreshRate() if screen is not None else 60.0
+        return 1.0 / max(1.0, fps)
+
+    # Request a repaint. Requests that arrive while one is already scheduled
+    # are merged into it; otherwise the paint is scheduled for one interval
+    # after the previous paint.
+    def schedule_repaint(self):
+        self.repaint_requests += 1
+        if self._repaint_timer.isActive():
+            self.repaints_coalesced += 1
+            return
+        wait = self._last_paint + self.repaint_interval() - time.perf_counter()
+        self._repaint_timer.start(max(0, round(wait * 1000)))
+
+    def set_max_fps(self, fps):
+        self.max_fps = fps
+        self.schedule_repaint()
+
+    def repaint_stats(self):
+        return {
+            "requests": self.repaint_requests,
+            "coalesced": self.repaints_coalesced,
+            "repaints": self.repaints,
+        }
+
+    def set_frame(self, frame, scale=1.0, timestamp=0.0):
         # Update the video frame
         self.frame = frame
-        self.update()
+        self.frame_scale = scale
+        self.frame_timestamp = timestamp
+        self.frame_id += 1
+        self.schedule_repaint()
+
+    # Map one image axis onto the widget for the current zoom.
+    # When the scaled image fits, it is centered. When it overflows (zoom in),
+    # the view is anchored on center_focus and clamped to the image edges.
+    # Returns the offset of image pixel 0, the visible source range [s0, s1)
+    # and its destination range [d0, d1) in widget pixels.
+    def _axis_viewport(self, size, widget_size, focus):
+        zoom = self.zoom_factor
+        scaled = size * zoom
+        if scaled <= widget_size:
+            offset = (widget_size - scaled) / 2
+        else:
+            offset = min(0.0, max(widget_size - scaled, widget_size / 2 - focus * zoom))
+
+        s0 = max(0, math.floor(-offset / zoom))
+        s1 = min(size, math.ceil((widget_size - offset) / zoom))
+        d0 = round(offset + s0 * zoom)
+        d1 = round(offset + s1 * zoom)
+        return offset, s0, s1, d0, d1
+
+    def compute_viewport(self, frame_w, frame_h):
+        """
+        Return (offset_x, offset_y, src, dst) for a frame of the given size.
+        Frame pixel (x, y) is drawn at (offset_x + x * zoom, offset_y + y * zoom);
+        src = (x0, y0, x1, y1) is the visible part of the frame and
+        dst = (x0, y0, x1, y1) the widget rectangle it is drawn into.
+        """
+        offset_x, sx0, sx1, dx0, dx1 = self._axis_viewport(
+            frame_w, self.width(), self.center_focus[0]
+        )
+        offset_y, sy0, sy1, dy0, dy1 = self._axis_viewport(
+            frame_h, self.height(), self.center_focus[1]
+        )
+        return offset_x, offset_y, (sx0, sy0, sx1, sy1), (dx0, dy0, dx1, dy1)
+
+    # Render the visible part of the frame into a pixmap. The crop is a NumPy
+    # view and is resized once to the destination size before it is wrapped
+    # for Qt, so the cost follows the window size instead of the sensor size.
+    def render_frame(self, src, dst):
+        sx0, sy0, sx1, sy1 = src
+        dx0, dy0, dx1, dy1 = dst
+        dst_w, dst_h = dx1 - dx0, dy1 - dy0
+        if dst_w <= 0 or dst_h <= 0:
+            return None
+
+        # src is in sensor pixels, map it onto the (possibly reduced) frame
+        scale = self.frame_scale
+        crop = self.frame[
+            round(sy0 * scale) : round(sy1 * scale),
+            round(sx0 * scale) : round(sx1 * scale),
+        ]
+        stats = pipeline_stats
+        start = time.perf_counter() if stats.enabled else 0.0
+        if crop.shape[1] == dst_w and crop.shape[0] == dst_h:
+            scaled = crop  # 1:1, hand the capture buffer to Qt as is
+        else:
+            scaled = resize_for_display(crop, dst_w, dst_h, self.zoom_factor / scale)
+        if stats.enabled:
+            scaled_at = time.perf_counter()
+            stats.add("scale", start, scaled_at)
+            start = scaled_at
+
+        # No cvtColor: Qt reads BGR (or 2-D grayscale frames) directly. The
+        # buffer only has to outlive the QImage until fromImage() has copied
+        # it into the pixmap.
+        if scaled.ndim == 2:
+            qimg, buffer = gray_to_qimage(scaled)
+        else:
+            qimg, buffer = bgr_to_qimage(scaled)
+        pixmap = QPixmap.fromImage(qimg)
+        del qimg, buffer
+        if stats.enabled:
+            stats.add("convert", start)
+        return pixmap
+
+    # Draw the frame from the cached pixmap. The cache is rebuilt only when
+    # the frame, the zoom, the widget size or the focus centre changes, so
+    # overlay-only repaints (slider drags) skip the resize entirely.
+    def draw_frame(self, painter, src, dst):
+        dx0, dy0, dx1, dy1 = dst
+        if dx0 > 0 or dy0 > 0 or dx1 < self.width() or dy1 < self.height():
+            painter.fillRect(self.rect(), QColor(0, 0, 0))
+
+        key = (
+            self.frame_id,
+            self.zoom_factor,
+            self.width(),
+            self.height(),
+            self.center_focus,
+        )
+        if key != self._frame_cache_key:
+            self._frame_cache = self.render_frame(src, dst)
+            self._frame_cache_key = key
+        if self._frame_cache is not None:
+            painter.drawPixmap(dx0, dy0, self._frame_cache)
 
     def paintEvent(self, event):
+        self._last_paint = time.perf_counter()
+        self.repaints += 1
+        start = self._last_paint if pipeline_stats.enabled else 0.0
         painter = QPainter(self)
 
         # Set anti-aliasing and smooth pixmap transform for better quality
@@ -83,110 +344,307 @@ class VideoWindow(QWidget):
         painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform)
 
         if self.frame is not None:
-            rgb_image = cv2.cvtColor(self.frame, cv2.COLOR_BGR2RGB)
-            h, w, ch = rgb_image.shape
-            bytes_per_line = ch * w
-            qimg = QImage(
-                rgb_image.data, w, h, bytes_per_line, QImage.Format.Format_RGB888
-            )
-
-            scaled_width = int(self.zoom_factor * w)
-            scaled_height = int(self.zoom_factor * h)
-            pixmap = QPixmap.fromImage(qimg).scaled(
-                scaled_width, scaled_height, Qt.AspectRatioMode.KeepAspectRatio
-            )
-            pixmap_x = (self.width() - pixmap.width()) // 2
-            pixmap_y = (self.height() - pixmap.height()) // 2
-
-            painter.drawPixmap(pixmap_x, pixmap_y, pixmap)
+            h, w = self.frame.shape[:2]
+            h, w = round(h / self.frame_scale), round(w / self.frame_scale)
+            offset_x, offset_y, src, dst = self.compute_viewport(w, h)
+            self.draw_frame(painter, src, dst)
 
             # Calcolo corretto del centro in base a center_focus
-            center_x = pixmap_x + self.center_focus[0] * self.zoom_factor
-            center_y = pixmap_y + self.center_focus[1] * self.zoom_factor
-
-            # Disegna lo zoom factor in alto a sinistra
-            zoom_text = f"Zoom: {self.zoom_factor:.2f}x"
-            font = painter.font()
-            font.setPointSize(14)
-            painter.setFont(font)
-
-            text_margin = 10
-            text_color = QColor(255, 255, 255)
-            bg_color = QColor(0, 0, 0, 160)  # sfondo semi-trasparente
-
-            # Calcola il rettangolo del testo
-            text_rect = painter.boundingRect(
-                0,
-                0,
-                200,
-                40,
-                Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignVCenter,
-                zoom_text,
-            )
-            text_rect.moveTo(text_margin, text_margin)
-            # Disegna rettangolo di sfondo e poi il testo
-            painter.fillRect(text_rect, bg_color)
-            painter.setPen(text_color)
-            painter.drawText(
-                text_rect,
-                Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignVCenter,
-                zoom_text,
-            )
-
-            if self.offset_enabled:
-                center_x += self.center_offset[0] * self.zoom_factor
-                center_y += self.center_offset[1] * self.zoom_factor
-
-            # Disegna cerchi
-            for circle in self.circles:
-                if circle["visible"]:
-                    pen = QPen(circle["color"])
-                    pen.setWidthF(
-                        circle["thickness"] * self.zoom_factor
-                    )  # Zoom sullo spessore
-                    painter.setPen(pen)
-                    painter.setBrush(Qt.BrushStyle.NoBrush)
-
-                    scaled_radius = (
-                        circle["radius"] * self.zoom_factor
-                    )  # Zoom sul raggio
-                    painter.drawEllipse(
-                        QPointF(center_x, center_y), scaled_radius, scaled_radius
-                    )
-
-            # Disegna croce solo se visibile
-            if self.cross["visible"]:
-                pen = QPen(self.cross["color"])
+            center_x = offset_x + self.center_focus[0] * self.zoom_factor
+            center_y = offset_y + self.center_focus[1] * self.zoom_factor
+
+            self.draw_overlay(painter, center_x, center_y)
+            if self.analysis is not None:
+                self.draw_analysis(painter, offset_x, offset_y)
+            if self.histogram is not None:
+                self.draw_histogram(painter)
+            if self.hud_enabled:
+                self.draw_hud(painter)
+            painter.end()
+            if pipeline_stats.enabled and start:
+                pipeline_stats.add("paint", start)
+
+            if self.frame_id != self._painted_frame_id:
+                self._painted_frame_id = self.frame_id
+                self.framePainted.emit(
+                    self.frame_id, self.frame_timestamp, time.perf_counter()
+                )
+        else:
+            painter.fillRect(self.rect(), QColor(0, 0, 0))
+
+    # Draw the overlay from the cached transparent layer. The layer is
+    # re-rendered only when a setter marked it dirty or the zoom, the widget
+    # size or the overlay centre moved, so a new camera frame costs just one
+    # extra composite instead of antialiased circles, cross trig and text.
+    def draw_overlay(self, painter, center_x, center_y):
+        start = time.perf_counter() if pipeline_stats.enabled else 0.0
+        key = (self.width(), self.height(), self.zoom_factor, center_x, center_y)
+        if self._overlay_dirty or key != self._overlay_key:
+            self._overlay = self.render_overlay(center_x, center_y)
+            self._overlay_key = key
+            self._overlay_dirty = False
+        origin, layer = self._overlay
+        painter.drawImage(origin, layer)
+        if pipeline_stats.enabled and start:
+            pipeline_stats.add("overlay", start)
+
+    # Draw the diagnostics HUD below the zoom label: display and capture
+    # rates, mean milliseconds per pipeline stage, queue depth and drops.
+    # Drawn on every paint (not cached) since the values change each frame.
+    def draw_hud(self, painter):
+        stats = pipeline_stats
+
+        def ms(stage):
+            value = stats.mean_ms(stage)
+            return "-" if value is None else f"{value:.1f}"
+
+        def fps(stage):
+            value = stats.rate(stage)
+            return "-" if value is None else f"{value:.1f}"
+
+        lines = [
+            f"Display {fps('convert')} fps   Capture {fps('read')} fps"
+            f"   Analysis {fps('analysis')} Hz ({ms('analysis')} ms)",
+            f"read {ms('read')}  decode {ms('decode')}  calib {ms('calibrate')}"
+            f"  average {ms('average')}  handoff {ms('handoff')} ms",
+            f"scale {ms('scale')}  convert {ms('convert')}  "
+            f"overlay {ms('overlay')}  paint {ms('paint')} ms",
+        ]
+        if self.hud_status is not None:
+            status = self.hud_status()
+            lines.append(f"queued {status['queued']}  dropped {status['dropped']}")
+        lines.append(
+            f"repaints {self.repaints}  coalesced {self.repaints_coalesced}"
+            f"  cap {self.max_fps or 'refresh'}"
+        )
+        text = "\n".join(lines)
+
+        font = self.font()
+        font.setPointSize(11)
+        painter.setFont(font)
+        flags = Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignTop
+        text_rect = painter.boundingRect(0, 0, 600, 200, flags, text)
+        text_rect.moveTo(10, 60)
+        painter.fillRect(text_rect.adjusted(-4, -2, 4, 2), QColor(0, 0, 0, 160))
+        painter.setPen(QColor(255, 255, 255))
+        painter.drawText(text_rect, flags, text)
+
+    # Draw the features found by the collimation analysis and the decentre
+    # arrows from center_focus to the secondary outline centre (cyan) and to
+    # the primary centre marker (green), or in star test mode the donut and
+    # its shadow. Results change at the analysis rate, so they are drawn
+    # directly instead of through the overlay layer.
+    def draw_analysis(self, painter, offset_x, offset_y):
+        zoom = self.zoom_factor
+
+        def point(x, y):
+            return QPointF(offset_x + x * zoom, offset_y + y * zoom)
+
+        def circle(feature, color, width=2.0):
+            if feature is None:
+                return
+            x, y, r = feature
+            painter.setPen(QPen(color, width))
+            painter.drawEllipse(point(x, y), r * zoom, r * zoom)
+
+        painter.setBrush(Qt.BrushStyle.NoBrush)
+        if self.analysis["star_test"]:
+            # star test: donut outline, central shadow and the arrow between
+            donut, shadow = self.analysis["donut"], self.analysis["shadow"]
+            circle(donut, QColor(255, 200, 0), 1.5)
+            circle(shadow, QColor(0, 255, 255))
+            if shadow is not None:
+                tip = point(shadow[0], shadow[1])
+                painter.setPen(QPen(QColor(0, 255, 255), 2.0))
+                painter.drawLine(point(donut[0], donut[1]), tip)
+                dx, dy = self.analysis["shadow_offset"]
+                label = point(donut[0] + donut[2], donut[1]) + QPointF(10, 0)
+                painter.drawText(label, f"shadow {dx:+.1f}, {dy:+.1f} px")
+            return
+        circle(self.analysis["primary"], QColor(255, 200, 0), 1.5)
+        for ring in self.analysis["rings"]:
+            circle(ring, QColor(255, 0, 255), 1.0)
+        circle(self.analysis["secondary"], QColor(0, 255, 255))
+        circle(self.analysis["marker"], QColor(0, 255, 0))
+
+        focus = point(*self.center_focus)
+        for key, color, label_offset in (
+            ("secondary", QColor(0, 255, 255), QPointF(10, -10)),
+            ("marker", QColor(0, 255, 0), QPointF(10, 22)),
+        ):
+            feature = self.analysis[key]
+            if feature is None:
+                continue
+            tip = point(feature[0], feature[1])
+            painter.setPen(QPen(color, 2.0))
+            painter.drawLine(focus, tip)
+            dx, dy = self.analysis[f"{key}_offset"]
+            painter.drawText(tip + label_offset, f"{key} {dx:+.1f}, {dy:+.1f} px")
+
+    def set_analysis(self, result):
+        self.analysis = result
+        self.schedule_repaint()
+
+    def set_hud_enabled(self, enabled):
+        self.hud_enabled = enabled
+        self.schedule_repaint()
+
+    # Draw the luminance histogram in the bottom left corner, square root
+    # scaled so small populations (the highlights) stay visible, with the
+    # clipped and crushed percentages above it (red when clipping)
+    def draw_histogram(self, painter):
+        width, height = 256, 70
+        box = QRectF(10, self.height() - height - 34, width, height)
+        painter.fillRect(box.adjusted(-4, -22, 4, 4), QColor(0, 0, 0, 160))
+        painter.save()
+        painter.translate(box.left(), box.bottom())
+        painter.scale(width / 256, -height)
+        painter.setPen(Qt.PenStyle.NoPen)
+        painter.setBrush(QColor(220, 220, 220, 200))
+        painter.drawPath(self._histogram_path)
+        painter.restore()
+
+        clipped = self.histogram["clipped"]
+        crushed = self.histogram["crushed"]
+        font = self.font()
+        font.setPointSize(10)
+        painter.setFont(font)
+        painter.setPen(
+            QColor(255, 80, 80) if clipped > 0.001 else QColor(255, 255, 255)
+        )
+        painter.drawText(
+            box.topLeft() + QPointF(0, -6),
+            f"clip {clipped:.2%}  crush {crushed:.2%}",
+        )
+
+    def set_histogram(self, histogram):
+        self.histogram = histogram
+        self._histogram_path = None
+        if histogram is not None:
+            heights = np.sqrt(histogram["counts"].astype(np.float64))
+            heights /= max(heights.max(), 1.0)
+            path = QPainterPath(QPointF(0, 0))
+            for level, value in enumerate(heights):
+                path.lineTo(level, value)
+                path.lineTo(level + 1, value)
+            path.lineTo(256, 0)
+            path.closeSubpath()
+            self._histogram_path = path
+        self.schedule_repaint()
+
+    # Bounding rectangle of everything render_overlay() draws, in widget
+    # coordinates. The layer is only this big, so compositing it costs in
+    # proportion to the overlay size rather than the window size.
+    def overlay_bounds(self, center_x, center_y):
+        bounds = QRectF(0, 0, 220, 60)  # zoom label
+        if self.offset_enabled:
+            center_x += self.center_offset[0] * self.zoom_factor
+            center_y += self.center_offset[1] * self.zoom_factor
+        extents = [
+            circle["radius"] + circle["thickness"]
+            for circle in self.circles
+            if circle["visible"]
+        ]
+        if self.cross["visible"]:
+            extents.append(self.cross["length"] + self.cross["thickness"])
+        if extents:
+            r = max(extents) * self.zoom_factor + 2
+            bounds = bounds.united(QRectF(center_x - r, center_y - r, 2 * r, 2 * r))
+        return bounds.toAlignedRect().intersected(self.rect())
+
+    # Render the zoom label, circles and cross into a new transparent layer.
+    # Returns the layer and the widget position of its top left corner.
+    def render_overlay(self, center_x, center_y):
+        bounds = self.overlay_bounds(center_x, center_y)
+        layer = QImage(bounds.size(), QImage.Format.Format_ARGB32_Premultiplied)
+        layer.fill(Qt.GlobalColor.transparent)
+        painter = QPainter(layer)
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        painter.translate(-bounds.x(), -bounds.y())
+
+        # Disegna lo zoom factor in alto a sinistra
+        zoom_text = f"Zoom: {self.zoom_factor:.2f}x"
+        font = self.font()  # the layer painter does not inherit the widget font
+        font.setPointSize(14)
+        painter.setFont(font)
+
+        text_margin = 10
+        text_color = QColor(255, 255, 255)
+        bg_color = QColor(0, 0, 0, 160)  # sfondo semi-trasparente
+
+        # Calcola il rettangolo del testo
+        text_rect = painter.boundingRect(
+            0,
+            0,
+            200,
+            40,
+            Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignVCenter,
+            zoom_text,
+        )
+        text_rect.moveTo(text_margin, text_margin)
+        # Disegna rettangolo di sfondo e poi il testo
+        painter.fillRect(text_rect, bg_color)
+        painter.setPen(text_color)
+        painter.drawText(
+            text_rect,
+            Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignVCenter,
+            zoom_text,
+        )
+
+        if self.offset_enabled:
+            center_x += self.center_offset[0] * self.zoom_factor
+            center_y += self.center_offset[1] * self.zoom_factor
+
+        # Disegna cerchi
+        for circle in self.circles:
+            if circle["visible"]:
+                pen = QPen(circle["color"])
                 pen.setWidthF(
-                    self.cross["thickness"] * self.zoom_factor
+                    circle["thickness"] * self.zoom_factor
                 )  # Zoom sullo spessore
                 painter.setPen(pen)
+                painter.setBrush(Qt.BrushStyle.NoBrush)
 
-                length = self.cross["length"] * self.zoom_factor  # Zoom sulla lunghezza
-                angle_rad = math.radians(self.cross["angle"])
+                scaled_radius = circle["radius"] * self.zoom_factor  # Zoom sul raggio
+                painter.drawEllipse(
+                    QPointF(center_x, center_y), scaled_radius, scaled_radius
+                )
 
-                # Calcola coordinate linee croce ruotate
-                x1 = -length * math.cos(angle_rad)
-                y1 = -length * math.sin(angle_rad)
-                x2 = length * math.cos(angle_rad)
-                y2 = length * math.sin(angle_rad)
+        # Disegna croce solo se visibile
+        if self.cross["visible"]:
+            pen = QPen(self.cross["color"])
+            pen.setWidthF(
+                self.cross["thickness"] * self.zoom_factor
+            )  # Zoom sullo spessore
+            painter.setPen(pen)
 
-                x3 = -length * math.cos(angle_rad + math.pi / 2)
-                y3 = -length * math.sin(angle_rad + math.pi / 2)
-                x4 = length * math.cos(angle_rad + math.pi / 2)
-                y4 = length * math.sin(angle_rad + math.pi / 2)
+            length = self.cross["length"] * self.zoom_factor  # Zoom sulla lunghezza
+            angle_rad = math.radians(self.cross["angle"])
 
-                v_line = QLineF(
-                    center_x + x1, center_y + y1, center_x + x2, center_y + y2
-                )
-                h_line = QLineF(
-                    center_x + x3, center_y + y3, center_x + x4, center_y + y4
-                )
+            # Calcola coordinate linee croce ruotate
+            x1 = -length * math.cos(angle_rad)
+            y1 = -length * math.sin(angle_rad)
+            x2 = length * math.cos(angle_rad)
+            y2 = length * math.sin(angle_rad)
 
-                painter.drawLine(v_line)
-                painter.drawLine(h_line)
-        else:
-            painter.fillRect(self.rect(), QColor(0, 0, 0))
+            x3 = -length * math.cos(angle_rad + math.pi / 2)
+            y3 = -length * math.sin(angle_rad + math.pi / 2)
+            x4 = length * math.cos(angle_rad + math.pi / 2)
+            y4 = length * math.sin(angle_rad + math.pi / 2)
+
+            v_line = QLineF(center_x + x1, center_y + y1, center_x + x2, center_y + y2)
+            h_line = QLineF(center_x + x3, center_y + y3, center_x + x4, center_y + y4)
+
+            painter.drawLine(v_line)
+            painter.drawLine(h_line)
+
+        painter.end()
+        return bounds.topLeft(), layer
+
+    # Mark the overlay layer for re-rendering and schedule a repaint
+    def invalidate_overlay(self):
+        self._overlay_dirty = True
+        self.schedule_repaint()
 
     # Zoom can be done with the mouse wheel
     # This method is called when the mouse wheel is scrolled
@@ -210,26 +668,27 @@ class VideoWindow(QWidget):
 
         self.zoom_factor = max(0.39, min(self.zoom_factor, 10.0))  # Range di zoom
 
-        self.update()
+        self.zoomChanged.emit(self.zoom_factor)
+        self.schedule_repaint()
 
     # method to seet cross properties
     def set_cross_property(self, prop, value):
         if prop in self.cross:
             self.cross[prop] = value
-            self.update()
+            self.invalidate_overlay()
 
     # Public methods to set properties of the overlay
 
     # Set the overlay center offset (x, y) in pixels.
     def set_center_offset(self, x, y):
         self.center_offset = (x, y * -1)  # Invert y-axis for correct display up/down
-        self.update()
+        self.invalidate_overlay()
 
     # Set the visibility of the cross overlay.
     def set_offset_enabled(self, enabled: bool):
         # Enable or disable the offset feature.
         self.offset_enabled = enabled
-        self.update()
+        self.invalidate_overlay()
 
     # Set a property of a specific circle by index.
     # index: index of the circle (0, 1, 2)
@@ -241,7 +700,7 @@ class VideoWindow(QWidget):
 
             if prop in self.circles[index]:
                 self.circles[index][prop] = value
-                self.update()
+                self.invalidate_overlay()
 
     # Update circle properties by index
     def update_circle(
@@ -257,9 +716,9 @@ class VideoWindow(QWidget):
                 self.circles[index]["thickness"] = thickness
             if visible is not None:
                 self.circles[index]["visible"] = visible
-            self.update()
+            self.invalidate_overlay()
 
     # Set the center of focus for the overlay.
     def set_center_focus(self, x, y):
         self.center_focus = (x, y)
-        self.update()
+        self.invalidate_overlay()